@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_gemini import FakeGemini
+from pair_index import PairIndex
+from pair_store import PairStore
+from prompt_builder import PromptBuilder
+
+# Offline benchmarks for the whole pipeline: build_pairs.py rebuilds, loading
+# the pair store, entry point startup, example selection, prompt assembly and end-to-end mention
+# throughput of discord_daniel_boy.py against a fake Gemini server. Each run is
+# appended to benchmark_results.jsonl so runs can be compared.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = "benchmark_results.jsonl"
+DANIEL_ID = "391754309840404492"
+
+# Gemini worker counts the mention benchmark sweeps over
+CONCURRENCY_SWEEP = (1, 2, 4, 8, 16)
+
+# Synthetic export sizes: (messages, channels)
+SIZES = {
+    "small": (20_000, 4),
+    "medium": (200_000, 12),
+    "large": (1_000_000, 40),
+}
+
+_WORDS = ("lol", "lmao", "bro", "what", "the", "game", "is", "so", "bad", "good", "berserk", "gym",
+          "coffee", "anyone", "up", "for", "destiny", "raid", "tonight", "nah", "yeah", "fr", "wait",
+          "why", "did", "you", "do", "that", "i", "cant", "believe", "this", "guy", "actually")
+
+def _sentence(rng):
+    return " ".join(rng.choices(_WORDS, k=rng.randint(1, 18)))
+
+def write_synthetic_exports(directory, n_messages, n_channels, seed=0):
+    """
+    Writes DiscordChatExporter-style exports, one per channel, with Daniel
+    sending about a third of the messages.
+    """
+    rng = random.Random(seed)
+    authors = [DANIEL_ID] + [str(100000000000000000 + i) for i in range(8)]
+    weights = [4] + [1] * 8
+    per_channel = n_messages // n_channels
+    for c in range(n_channels):
+        path = os.path.join(directory, f"Synthetic - channel-{c} [{900000000000000000 + c}].json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"guild": {"id": "1", "name": "Synthetic"}, ')
+            f.write(f'"channel": {{"id": "{900000000000000000 + c}", "name": "channel-{c}"}}, "messages": [')
+            for i in range(per_channel):
+                msg = {
+                    "id": str(i),
+                    "type": "Default",
+                    "timestamp": f"2024-01-01T00:00:00.{i:07d}+00:00",
+                    "content": _sentence(rng),
+                    "author": {"id": rng.choices(authors, weights)[0], "name": "someone"},
+                }
+                f.write(("," if i else "") + json.dumps(msg))
+            f.write(f'], "messageCount": {per_channel}}}')
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def _run_build(directory, *args):
+    """Runs build_pairs.py in directory as a child process; returns (seconds, peak RSS in MB)."""
+    script = (
+        "import resource, runpy, sys; "
+        f"sys.argv = ['build_pairs.py'] + {list(args)!r}; "
+        f"runpy.run_path({os.path.join(HERE, 'build_pairs.py')!r}, run_name='__main__'); "
+        "print('MAXRSS', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)"
+    )
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", script], cwd=directory, capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONPATH=HERE))
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"build_pairs.py {' '.join(args)} failed:\n{proc.stderr}")
+    maxrss = [line for line in proc.stderr.splitlines() if line.startswith("MAXRSS")][-1].split()[1]
+    return elapsed, int(maxrss) / 1024  # Linux reports KiB
+
+def bench_build(directory):
+    full_s, full_mb = _run_build(directory, "--full", "--store", "--index")
+    cold_s, _ = _run_build(directory)        # fills the incremental cache
+    warm_s, warm_mb = _run_build(directory)  # nothing changed
+    return {
+        "full_rebuild_s": full_s,
+        "full_rebuild_peak_mb": full_mb,
+        "incremental_cold_s": cold_s,
+        "incremental_warm_s": warm_s,
+        "incremental_warm_peak_mb": warm_mb,
+    }
+
+def bench_load(directory):
+    json_path = os.path.join(directory, "daniel_pairs_by_channel.json")
+    store_path = os.path.join(directory, "daniel_pairs.bin")
+
+    def load_json():
+        with open(json_path, encoding="utf-8") as f:
+            json.load(f)
+
+    return {
+        "pairs": len(PairStore(store_path)),
+        "json_load_ms": _timed(load_json, 3) * 1000,
+        "store_open_ms": _timed(lambda: PairStore(store_path), 20) * 1000,
+    }
+
+def bench_select_and_prompt(directory):
+    store = PairStore(os.path.join(directory, "daniel_pairs.bin"))
+    index = PairIndex(os.path.join(directory, "daniel_pairs.idx"))
+    rng = random.Random(1)
+    queries = [_sentence(rng) for _ in range(200)]
+    builder = PromptBuilder("You are Daniel. Reply exactly as Daniel would.\n\n")
+    examples = random.sample(store, 8)
+    it = iter(queries * 10)
+    return {
+        "select_random_us": _timed(lambda: random.sample(store, 8), 2000) * 1e6,
+        "select_index_ms": _timed(lambda: [store[i] for i in index.select(next(it), 8, 2)], len(queries)) * 1000,
+        "build_prompt_us": _timed(lambda: builder.build("yo what are you doing tonight", examples), 2000) * 1e6,
+    }
+
+def _python_ms(directory, args, stdin=None, repeat=5):
+    """Best wall time in ms of running python with args in directory."""
+    env = dict(os.environ, PYTHONPATH=HERE, GEMINI_API_KEY="fake")
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, *args], cwd=directory, input=stdin, capture_output=True,
+                              text=True, env=env)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"python {' '.join(args)} failed:\n{proc.stdout}{proc.stderr}")
+        best = min(best, elapsed)
+    return best * 1000
+
+def bench_startup(directory):
+    """
+    How quickly the entry points come up: bare imports (which should do no
+    work), preloading the dataset, and starting the CLI and quitting at once.
+    """
+    baseline = _python_ms(directory, ["-c", "pass"])
+    preload = (
+        "import time; start = time.perf_counter(); "
+        "import discord_daniel_boy as bot; bot.CORE.preload(); "
+        "print('PRELOAD', time.perf_counter() - start)"
+    )
+    return {
+        "interpreter_ms": baseline,
+        "import_core_ms": _python_ms(directory, ["-c", "import daniel_core"]) - baseline,
+        "import_bot_ms": _python_ms(directory, ["-c", "import discord_daniel_boy"]) - baseline,
+        "import_and_preload_ms": _python_ms(directory, ["-c", preload]) - baseline,
+        "cli_start_quit_ms": _python_ms(directory, [os.path.join(HERE, "chat_with_daniel_rest.py")], "quit\n"),
+    }
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class _FakeChannel:
+    def __init__(self, channel_id, replies):
+        self.id = channel_id
+        self.replies = replies
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content):
+        self.replies.append((time.perf_counter(), content))
+        return self
+
+    async def edit(self, content):
+        return self
+
+class _FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+
+    def __str__(self):
+        return self.display_name
+
+class _FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+class _FakeMessage:
+    def __init__(self, author, channel, guild):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+
+def _drive_mentions(bot, mentions, channels, window, workers, seed=2):
+    """
+    Submits mentions from distinct fake users spread randomly over channels
+    (or one channel each when channels is None) to a fresh MentionScheduler
+    with workers workers and as many Gemini threads. Returns (seconds until
+    all were answered, replies sent).
+    """
+    own_channel = channels is None
+    channels = mentions if own_channel else channels
+    replies = []
+    rng = random.Random(seed)
+    chans = [_FakeChannel(1000 + c, replies) for c in range(channels)]
+    guilds = [_FakeGuild(c % 4) for c in range(channels)]
+    executor = bot.GEMINI_EXECUTOR
+    bot.GEMINI_EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini")
+
+    async def drive():
+        scheduler = bot.MentionScheduler(window=window, workers=workers)
+        start = time.perf_counter()
+        for i in range(mentions):
+            c = i if own_channel else rng.randrange(channels)
+            await scheduler.submit(_FakeMessage(_FakeAuthor(i), chans[c], guilds[c]), _sentence(rng))
+            await asyncio.sleep(0)
+        # Every mention counts as pending for its author until it has been answered
+        while scheduler.user_pending:
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+
+    try:
+        return asyncio.run(drive()), len(replies)
+    finally:
+        bot.GEMINI_EXECUTOR.shutdown()
+        bot.GEMINI_EXECUTOR = executor
+
+def bench_mentions(directory, mentions, channels, latency, concurrency=CONCURRENCY_SWEEP):
+    """
+    Drives discord_daniel_boy's mention scheduler with fake Discord messages
+    against the fake Gemini server. Returns end-to-end throughput as deployed
+    (coalescing on, MAX_CONCURRENT_REQUESTS workers), and a sweep over worker
+    counts with every mention in its own channel and no coalescing window, so
+    it measures concurrency alone.
+    """
+    import gemini_client  # noqa: F401 -- needs requests; skip early if it's missing
+    import discord_daniel_boy as bot
+
+    fake = FakeGemini(latency=latency).start()
+    cwd = os.getcwd()
+    try:
+        os.chdir(directory)
+        bot.CORE.endpoint = fake.url()
+        bot.CORE.stream_endpoint = fake.url(stream=True)
+        bot.CORE.preload()
+
+        elapsed, replies = _drive_mentions(bot, mentions, channels, 0.05, bot.MAX_CONCURRENT_REQUESTS)
+        results = {
+            "mentions": mentions,
+            "replies": replies,
+            "gemini_requests": fake.requests,
+            "elapsed_s": elapsed,
+            "mentions_per_s": mentions / elapsed,
+            "fake_latency_s": latency,
+            "max_concurrency": bot.MAX_CONCURRENT_REQUESTS,
+        }
+
+        sweep = {}
+        for workers in concurrency:
+            elapsed, replies = _drive_mentions(bot, mentions, None, 0, workers)
+            sweep[f"workers_{workers}"] = {"mentions_per_s": mentions / elapsed, "replies": replies}
+            print(f"  {workers:>3} workers: {mentions / elapsed:.1f} mentions/s")
+        results["concurrency_sweep"] = sweep
+        return results
+    finally:
+        os.chdir(cwd)
+        fake.stop()
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def _compare(previous, current, prefix=""):
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            _compare(old or {}, value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"  {prefix}{key}: {old:.4g} -> {value:.4g} ({(value - old) / old * 100:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small", "medium"])
+    parser.add_argument("--mentions", type=int, default=200, help="mentions to drive through the Discord bot")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake Gemini latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENCY_SWEEP),
+                        help="worker counts to sweep the mention throughput over")
+    parser.add_argument("--output", default=RESULTS, help="JSON lines file each run is appended to")
+    args = parser.parse_args(argv)
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="daniel_bench_")
+    try:
+        for size in args.sizes:
+            n_messages, n_channels = SIZES[size]
+            directory = os.path.join(workdir, size)
+            os.makedirs(directory)
+            print(f"📝 Writing {size} synthetic exports ({n_messages} messages, {n_channels} channels)…")
+            write_synthetic_exports(directory, n_messages, n_channels)
+            print(f"⏱️ Benchmarking {size}…")
+            results[size] = {
+                "build": bench_build(directory),
+                "load": bench_load(directory),
+                "startup": bench_startup(directory),
+                "select": bench_select_and_prompt(directory),
+            }
+        print("⏱️ Benchmarking end-to-end mentions…")
+        try:
+            results["mentions"] = bench_mentions(os.path.join(workdir, args.sizes[0]), args.mentions,
+                                                 args.channels, args.latency, args.concurrency)
+        except ImportError as e:
+            # requests not installed here
+            print(f"❗ Skipping end-to-end mentions: {e}")
+            results["mentions"] = {"skipped": str(e)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    run = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    print(json.dumps(results, indent=2))
+
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if lines:
+            previous = json.loads(lines[-1])
+    if previous is not None:
+        print(f"📊 Compared with the previous run ({previous.get('git_rev')}, {previous.get('time')}):")
+        _compare(previous.get("results", {}), results)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"🗂 Appended results to {args.output}")
+
+if __name__ == "__main__":
+    main()
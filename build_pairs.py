@@ -1,61 +1,555 @@
+import argparse
 import glob
+import gzip
+import hashlib
+import heapq
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from operator import itemgetter
 
-def main():
-    print("🔍 Scanning for JSON files…")
-    files = glob.glob("*.json")
-    print(f"Found {len(files)} JSON files.")
-
-    all_msgs = []
-    for i, path in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] Loading {path}…", end="\r")
-        with open(path, encoding="utf-8") as f:
-            data = json.load(f)
-        # Accept both list and dict-based JSON exports
-        if isinstance(data, list):
-            msgs = data
-        else:
-            msgs = data.get("messages", data.get("Messages", [])) or []
-        all_msgs.extend(msgs)
-    print(f"\n✅ Loaded a total of {len(all_msgs)} messages.")
+from pair_filters import (BAND_ROWS, EXCLUDED_CHANNELS, MAX_CHARS, MAX_URL_RATIO, MIN_CHARS, NEAR_DUP_MIN_SHINGLES,
+                          NUM_BANDS, PairFilter, pair_features)
+from pair_index import DEFAULT_INDEX, build_index
+from pair_store import DEFAULT_STORE, PairStoreWriter
+
+# Replace with actual IDs
+DANIEL_ID = "391754309840404492"
+# If you want only your messages, set MY_ID below; otherwise leave None
+MY_ID = None  # e.g. "123456789012345678"
+
+OUTPUT = "daniel_pairs_by_channel.json"
+# Our own outputs live next to the exports; never read them back in as input
+OUTPUT_FILES = {"daniel_pairs.json", OUTPUT}
+
+# Incremental rebuilds keep each export's pairs here, keyed by content hash
+CACHE_DIR = ".pair_cache"
+MANIFEST = os.path.join(CACHE_DIR, "manifest.json")
+
+# Pairing only ever needs these four fields, so every export message is
+# boiled down to a (timestamp, channel_id, author_id, content) tuple.
+TIMESTAMP, CHANNEL, AUTHOR, CONTENT = range(4)
+
+# With --merge-runs, Daniel messages sent back to back in a channel (nothing else
+# in between, each within MERGE_GAP seconds of the last) become one reply
+MERGE_GAP = 120
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_NUMBER_CHARS = "0123456789+-.eE"  # anything that could carry on a number
+
+def _author_id(msg):
+    author = msg.get("author", {}) or msg.get("Author", {})
+    return author.get("id") or author.get("Id")
 
-    print("🔃 Sorting messages by timestamp…")
+def _channel_id(msg):
+    return msg.get("channel_id") or msg.get("ChannelId")
+
+def _content(msg):
+    return msg.get("content") or msg.get("Content", "")
+
+def normalize(msg, channel_id=None):
+    """
+    Shrinks a raw export message down to the tuple pairing works on.
+    channel_id is the export's own channel, used when messages don't carry one.
+    """
     # ISO-8601 timestamps sort lexicographically; handle both keys
-    all_msgs.sort(key=lambda m: m.get("timestamp", m.get("Timestamp", "")))
+    timestamp = msg.get("timestamp", msg.get("Timestamp", "")) or ""
+    return (timestamp, _channel_id(msg) or channel_id, _author_id(msg), _content(msg))
+
+class _ExportReader:
+    """
+    Minimal incremental JSON reader: keeps only a small window of the file in
+    memory and decodes one value at a time with JSONDecoder.raw_decode.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            return False
+        self.buf += data
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, expected):
+        ch = self.peek()
+        if ch != expected:
+            raise ValueError(f"expected {expected!r} at offset {self.pos}, found {ch!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        # Drop what's already been consumed so the window doesn't grow
+        if self.pos >= self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the end of the window ("12" of "123", "1." of "1.5")
+            # still decodes; read on until something that can't continue it follows
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (end == len(self.buf) or self.buf[end] in _NUMBER_CHARS) and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yields the elements of the array at the current position one by one."""
+        if self.peek() == "n":  # "messages": null
+            self.value()
+            return
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self.pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise ValueError(f"expected ',' or ']' at offset {self.pos - 1}, found {ch!r}")
+
+def iter_export(path, chunk_size=1 << 16):
+    """
+    Streams the normalized messages of one export without loading the file,
+    chunk_size characters at a time. Accepts both list and dict-based JSON
+    exports.
+    """
+    with open(path, encoding="utf-8") as f:
+        reader = _ExportReader(f, chunk_size)
+        if reader.peek() == "[":
+            for msg in reader.array():
+                if isinstance(msg, dict):
+                    yield normalize(msg)
+            return
+
+        reader.take("{")
+        if reader.peek() == "}":
+            return
+        channel_id = None
+        while True:
+            key = reader.value()
+            reader.take(":")
+            if key in ("messages", "Messages"):
+                for msg in reader.array():
+                    if isinstance(msg, dict):
+                        yield normalize(msg, channel_id)
+            elif key in ("channel", "Channel"):
+                info = reader.value()
+                if isinstance(info, dict):
+                    channel_id = info.get("id") or info.get("Id")
+            else:
+                reader.value()
+            ch = reader.peek()
+            reader.pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError(f"{path}: expected ',' or '}}' at offset {reader.pos - 1}, found {ch!r}")
+
+def load_export(path):
+    """
+    Process-pool worker: parses one export into a list of normalized tuples,
+    which pickle far smaller than the raw message dicts.
+    """
+    return list(iter_export(path))
+
+def find_exports():
+    """Returns the Discord export files in the current directory, in a stable order."""
+    return sorted(path for path in glob.glob("*.json") if path not in OUTPUT_FILES)
+
+def merge_exports(exports):
+    """
+    k-way merges per-export message streams by timestamp. Each export is
+    already in timestamp order, so this never needs to hold more than one
+    message per export.
+    """
+    return heapq.merge(*exports, key=itemgetter(TIMESTAMP))
+
+def iter_pair_rows(msgs, merge_runs=False):
+    """
+    Pairs every Daniel message with the last non-Daniel (or optionally your)
+    message in the same channel, in a single forward pass. Yields
+    (timestamp, channel_id, user, daniel) rows, timestamped by Daniel's message.
+    """
+    if merge_runs:
+        yield from _merged_pair_rows(msgs)
+        return
+    # channel id -> most recent message Daniel could be replying to
+    last_prompt = {}
+    for msg in msgs:
+        author_id = msg[AUTHOR]
+        if author_id == DANIEL_ID:
+            prev = last_prompt.get(msg[CHANNEL])
+            if prev is not None:
+                user_text = prev[CONTENT].strip()
+                daniel_text = msg[CONTENT].strip()
+                if user_text and daniel_text:
+                    yield (msg[TIMESTAMP], msg[CHANNEL], user_text, daniel_text)
+        elif MY_ID is None or author_id == MY_ID:
+            last_prompt[msg[CHANNEL]] = msg
+
+def _seconds(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return None
+
+def _merged_pair_rows(msgs):
+    """
+    iter_pair_rows with runs of Daniel messages joined into one reply. A run
+    is only finished once its channel moves on or goes quiet for MERGE_GAP,
+    so finished rows wait in a heap until no open run started before them,
+    which keeps the output in timestamp order.
+    """
+    last_prompt = {}
+    runs = {}   # channel id -> [start timestamp, seq, last seen (seconds), user text, Daniel's texts]
+    ready = []  # (timestamp, seq, row)
+    seq = 0
+
+    def close(channel_id):
+        start, n, _, user_text, texts = runs.pop(channel_id)
+        heapq.heappush(ready, (start, n, (start, channel_id, user_text, "\n".join(texts))))
+
+    for msg in msgs:
+        channel_id = msg[CHANNEL]
+        now = _seconds(msg[TIMESTAMP])
+        if now is not None:
+            for stale in [c for c, run in runs.items() if now - run[2] > MERGE_GAP]:
+                close(stale)
+
+        run = runs.get(channel_id)
+        if msg[AUTHOR] == DANIEL_ID:
+            daniel_text = msg[CONTENT].strip()
+            if run is not None and now is not None:
+                # Still within MERGE_GAP, or the stale check above would have closed it
+                if daniel_text:
+                    run[4].append(daniel_text)
+                run[2] = now
+            else:
+                prev = last_prompt.get(channel_id)
+                if prev is not None:
+                    user_text = prev[CONTENT].strip()
+                    if user_text and daniel_text:
+                        seq += 1
+                        if now is None:  # can't tell how far apart messages are; don't merge
+                            heapq.heappush(ready, (msg[TIMESTAMP], seq, (msg[TIMESTAMP], channel_id, user_text, daniel_text)))
+                        else:
+                            runs[channel_id] = [msg[TIMESTAMP], seq, now, user_text, [daniel_text]]
+        else:
+            if run is not None:
+                close(channel_id)
+            if MY_ID is None or msg[AUTHOR] == MY_ID:
+                last_prompt[channel_id] = msg
 
-    # Replace with actual IDs
-    DANIEL_ID = "391754309840404492"
-    # If you want only your messages, set MY_ID below; otherwise leave None
-    MY_ID = None  # e.g. "123456789012345678"
+        oldest_open = min((run[0], run[1]) for run in runs.values()) if runs else None
+        while ready and (oldest_open is None or ready[0][:2] < oldest_open):
+            yield heapq.heappop(ready)[2]
 
+    for channel_id in list(runs):
+        close(channel_id)
+    while ready:
+        yield heapq.heappop(ready)[2]
+
+def as_pairs(rows):
+    """Turns pair rows into the {"user", "daniel"} dicts we write out."""
+    for row in rows:
+        yield {"user": row[2], "daniel": row[3]}
+
+def extract_pairs(msgs):
+    """Same as iter_pair_rows, but yields the {"user", "daniel"} dicts we write out."""
+    return as_pairs(iter_pair_rows(msgs))
+
+def extract_pairs_walkback(all_msgs):
+    """
+    The original quadratic pairing: walks back from each Daniel message to
+    the last eligible message in the same channel. Kept only for --verify.
+    """
     pairs = []
     for i, msg in enumerate(all_msgs):
-        author = msg.get("author", {}) or msg.get("Author", {})
-        author_id = author.get("id") or author.get("Id")
-        if author_id == DANIEL_ID:
-            channel_id = msg.get("channel_id") or msg.get("ChannelId")
-            # Walk back to find the last non-Daniel (or optionally your) message in the same channel
+        if msg[AUTHOR] == DANIEL_ID:
             j = i - 1
             while j >= 0:
                 prev = all_msgs[j]
-                prev_auth = prev.get("author", {}) or prev.get("Author", {})
-                prev_id = prev_auth.get("id") or prev_auth.get("Id")
-                prev_chan = prev.get("channel_id") or prev.get("ChannelId")
-                if prev_chan == channel_id and prev_id != DANIEL_ID and (MY_ID is None or prev_id == MY_ID):
-                    user_msg = prev.get("content") or prev.get("Content", "")
-                    daniel_msg = msg.get("content") or msg.get("Content", "")
-                    user_text = user_msg.strip()
-                    daniel_text = daniel_msg.strip()
+                prev_id = prev[AUTHOR]
+                if prev[CHANNEL] == msg[CHANNEL] and prev_id != DANIEL_ID and (MY_ID is None or prev_id == MY_ID):
+                    user_text = prev[CONTENT].strip()
+                    daniel_text = msg[CONTENT].strip()
                     if user_text and daniel_text:
                         pairs.append({"user": user_text, "daniel": daniel_text})
                     break
                 j -= 1
+    return pairs
+
+def write_pairs(pairs, path):
+    """
+    Writes pairs one at a time in the same layout json.dump(indent=2) gives,
+    so the output never has to be held in memory. Returns the pair count.
+    """
+    count = 0
+    # Swap the file in at the end so a failed run never leaves half an output behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for pair in pairs:
+            out.write("[\n  " if count == 0 else ",\n  ")
+            out.write(json.dumps(pair, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+            count += 1
+        out.write("\n]" if count else "[]")
+    os.replace(tmp_path, path)
+    return count
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_path(digest):
+    return os.path.join(CACHE_DIR, digest + ".jsonl.gz")
+
+def _cache_config(merge_runs=False):
+    # Cached pairs are only valid for the IDs, row layout and near-duplicate hashing they were built with
+    return {"daniel_id": DANIEL_ID, "my_id": MY_ID, "rows": "timestamp,channel,user,daniel,filter_features",
+            "merge_runs": merge_runs, "near_dup": [NUM_BANDS, BAND_ROWS, NEAR_DUP_MIN_SHINGLES]}
+
+def cache_export(path, digest, merge_runs=False):
+    """
+    Pairs a single export on its own and stores its rows as gzipped JSON
+    lines, each with its pair_features() so filtering the cached rows later
+    is only set lookups. Returns the channel ids the export covers. Runs in a
+    worker process under --workers.
+    """
+    channels = set()
+
+    def msgs():
+        for msg in iter_export(path):
+            channels.add(msg[CHANNEL])
+            yield msg
+
+    tmp_path = _cache_path(digest) + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        for row in iter_pair_rows(msgs(), merge_runs):
+            out.write(json.dumps(row + (pair_features(row[2], row[3]),), ensure_ascii=False))
+            out.write("\n")
+    os.replace(tmp_path, _cache_path(digest))
+    return list(channels)
+
+def read_cached_rows(digest):
+    with gzip.open(_cache_path(digest), "rt", encoding="utf-8") as f:
+        for line in f:
+            yield tuple(json.loads(line))
+
+def load_manifest(merge_runs=False):
+    try:
+        with open(MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("config") != _cache_config(merge_runs):
+        return {}
+    return manifest.get("exports", {})
+
+def save_manifest(entries, merge_runs=False):
+    tmp_path = MANIFEST + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"config": _cache_config(merge_runs), "exports": entries}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, MANIFEST)
+    # Drop cached pairs for exports that changed or went away
+    live = {_cache_path(entry["sha256"]) for entry in entries.values()}
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.jsonl.gz")):
+        if path not in live:
+            os.remove(path)
+
+def update_cache(files, workers=1, merge_runs=False):
+    """
+    Re-pairs only the exports whose size, mtime and content hash don't match
+    the manifest, and returns the fresh manifest entries for all of them.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cached = load_manifest(merge_runs)
+    entries = {}
+    stale = []
+    for path in files:
+        st = os.stat(path)
+        entry = cached.get(path)
+        if entry is not None and os.path.exists(_cache_path(entry["sha256"])):
+            if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                entries[path] = entry
+                continue
+        digest = file_digest(path)
+        if entry is not None and entry["sha256"] == digest and os.path.exists(_cache_path(digest)):
+            # Touched but not changed
+            entries[path] = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns)
+            continue
+        entries[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        stale.append(path)
+
+    print(f"♻️ {len(files) - len(stale)} exports unchanged, re-pairing {len(stale)}…")
+    digests = [entries[path]["sha256"] for path in stale]
+    flags = [merge_runs] * len(stale)
+    if workers > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(stale))) as pool:
+            results = list(pool.map(cache_export, stale, digests, flags))
+    else:
+        results = list(map(cache_export, stale, digests, flags))
+    for path, channels in zip(stale, results):
+        entries[path]["channels"] = channels
+
+    save_manifest(entries, merge_runs)
+    return entries
+
+def _channels_overlap(files, entries):
+    seen = set()
+    for path in files:
+        channels = set(entries[path]["channels"])
+        if channels & seen:
+            return True
+        seen |= channels
+    return False
+
+def cached_rows(files, entries):
+    """Merges every export's cached rows back into one timestamp-ordered stream."""
+    return heapq.merge(*(read_cached_rows(entries[path]["sha256"]) for path in files), key=itemgetter(0))
+
+def full_rebuild(files, workers=1):
+    """Returns every message across all exports, merged by timestamp."""
+    if workers > 1 and len(files) > 1:
+        print(f"⚙️ Parsing exports with {workers} workers…")
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            exports = list(pool.map(load_export, files))
+        print(f"✅ Loaded a total of {sum(len(e) for e in exports)} messages.")
+        print("🔃 Merging messages by timestamp…")
+        return merge_exports(exports)
+    print("🔃 Streaming and merging messages by timestamp…")
+    return merge_exports(iter_export(path) for path in files)
+
+def _also_store(pairs, writer):
+    for pair in pairs:
+        writer.add(pair["user"], pair["daniel"])
+        yield pair
+
+def _collect_users(pairs, user_texts):
+    for pair in pairs:
+        user_texts.append(pair["user"])
+        yield pair
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build (user, Daniel) reply pairs from Discord exports.")
+    parser.add_argument("--verify", action="store_true",
+                        help="also run the old walk-back pairing and check both give identical pairs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse exports in N worker processes instead of streaming them one by one")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the pair cache and rebuild from every export")
+    parser.add_argument("--check", action="store_true",
+                        help="also do a full rebuild and check the incremental pairs match it")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE, metavar="PATH",
+                        help=f"also write a memory-mappable binary pair store (default: {DEFAULT_STORE})")
+    parser.add_argument("--index", nargs="?", const=DEFAULT_INDEX, metavar="PATH",
+                        help=f"also build the few-shot retrieval index over the user messages (default: {DEFAULT_INDEX})")
+    parser.add_argument("--merge-runs", action="store_true",
+                        help=f"join Daniel messages sent back to back (within {MERGE_GAP}s) into one reply")
+    parser.add_argument("--no-filter", action="store_true",
+                        help="keep every pair: skip dedup and the quality filters")
+    parser.add_argument("--no-near-dup", action="store_true",
+                        help="only drop exact duplicates, not near duplicates")
+    parser.add_argument("--min-chars", type=int, default=MIN_CHARS,
+                        help=f"drop pairs with a side shorter than this (default: {MIN_CHARS})")
+    parser.add_argument("--max-chars", type=int, default=MAX_CHARS,
+                        help=f"drop pairs with a side longer than this (default: {MAX_CHARS})")
+    parser.add_argument("--max-url-ratio", type=float, default=MAX_URL_RATIO,
+                        help=f"drop pairs with a side that's more than this share links (default: {MAX_URL_RATIO})")
+    parser.add_argument("--exclude-channel", action="append", default=[], metavar="ID",
+                        help="also drop pairs from this channel (repeatable; mudae is always excluded)")
+    args = parser.parse_args(argv)
+
+    # A store or index from an earlier build would no longer match the pairs about to be
+    # written, and the bots would keep serving it; rebuild them along with the JSON
+    if args.store is None and os.path.exists(DEFAULT_STORE):
+        print(f"♻️ Also rebuilding the existing {DEFAULT_STORE}")
+        args.store = DEFAULT_STORE
+    if args.index is None and os.path.exists(DEFAULT_INDEX):
+        print(f"♻️ Also rebuilding the existing {DEFAULT_INDEX}")
+        args.index = DEFAULT_INDEX
+
+    print("🔍 Scanning for JSON exports…")
+    files = find_exports()
+    print(f"Found {len(files)} JSON exports.")
+
+    if args.verify:
+        msgs = list(full_rebuild(files, args.workers))
+        print(f"✅ Loaded a total of {len(msgs)} messages.")
+        print("🧪 Verifying against walk-back pairing…")
+        if extract_pairs_walkback(msgs) != list(extract_pairs(msgs)):
+            raise SystemExit("❗ Error: linear and walk-back pairing disagree.")
+        print("✅ Both pairings match.")
+
+    rows = None
+    if not args.full:
+        entries = update_cache(files, args.workers, args.merge_runs)
+        if _channels_overlap(files, entries):
+            # Pairing runs across exports of the same channel, so per-export caches can't be stitched together
+            print("❗ Warning: some exports share a channel; falling back to a full rebuild.")
+        else:
+            rows = cached_rows(files, entries)
+            if args.check:
+                print("🧪 Checking incremental pairs against a full rebuild…")
+                rows = list(rows)
+                if [row[:4] for row in rows] != list(iter_pair_rows(full_rebuild(files, args.workers), args.merge_runs)):
+                    raise SystemExit("❗ Error: incremental pairs differ from a full rebuild; rerun with --full.")
+                print("✅ Incremental pairs match a full rebuild.")
+    if rows is None:
+        rows = iter_pair_rows(full_rebuild(files, args.workers), args.merge_runs)
+
+    pair_filter = None
+    if not args.no_filter:
+        pair_filter = PairFilter(args.min_chars, args.max_chars, args.max_url_ratio,
+                                 EXCLUDED_CHANNELS | set(args.exclude_channel), near_dup=not args.no_near_dup)
+        rows = pair_filter.filter(rows)
+    pairs = as_pairs(rows)
+
+    user_texts = []
+    if args.index:
+        pairs = _collect_users(pairs, user_texts)
+
+    if args.store:
+        with PairStoreWriter(args.store) as writer:
+            count = write_pairs(_also_store(pairs, writer), OUTPUT)
+        print(f"📦 Wrote binary pair store {args.store}")
+    else:
+        count = write_pairs(pairs, OUTPUT)
 
-    output = "daniel_pairs_by_channel.json"
-    with open(output, "w", encoding="utf-8") as out:
-        json.dump(pairs, out, indent=2, ensure_ascii=False)
+    if args.index:
+        print("🔎 Building retrieval index…")
+        build_index(user_texts, args.index)
+        print(f"🔎 Wrote retrieval index {args.index}")
 
-    print(f"🗂 Generated {len(pairs)} pairs in {output}")
+    if pair_filter is not None:
+        print(pair_filter.report())
+    print(f"🗂 Generated {count} pairs in {OUTPUT}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+class FakeChannel:
+    """Stands in for a Discord channel (and the messages sent to it), logging every send and edit."""
+
+    def __init__(self, channel_id=1):
+        self.id = channel_id
+        self.events = []  # (seconds since created, "send" / "edit", content)
+        self.start = time.perf_counter()
+
+    def _log(self, kind, content):
+        self.events.append((time.perf_counter() - self.start, kind, content))
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content):
+        self._log("send", content)
+        return self
+
+    async def edit(self, content):
+        self._log("edit", content)
+        return self
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+@pytest.fixture
+def fake_core(tmp_path, monkeypatch):
+    """
+    Points discord_daniel_boy at a fresh DanielCore over a tiny dataset, with
+    no retries, cache or quota. Returns a function that starts a FakeGemini
+    with the given options and aims the core at it.
+    """
+    pytest.importorskip("requests")
+    import discord_daniel_boy as bot
+    import gemini_client
+    from daniel_core import DanielCore
+    from fake_gemini import FakeGemini
+
+    for name in ("DANIEL_RESPONSE_CACHE", "DANIEL_QUOTA_RPM", "DANIEL_QUOTA_TPM"):
+        monkeypatch.delenv(name, raising=False)
+    with open(tmp_path / "daniel_pairs_by_channel.json", "w", encoding="utf-8") as f:
+        json.dump([{"user": "yo", "daniel": "sup"}, {"user": "gym?", "daniel": "leg day"}], f)
+    monkeypatch.chdir(tmp_path)
+    core = DanielCore("You are Daniel.\n\n", {"temperature": 0.6, "maxOutputTokens": 300})
+    monkeypatch.setattr(bot, "CORE", core)
+    monkeypatch.setattr(gemini_client, "MAX_RETRIES", 0)
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("latency", 0)
+        fake = FakeGemini(**kwargs).start()
+        servers.append(fake)
+        core.endpoint = fake.url()
+        core.stream_endpoint = fake.url(stream=True)
+        return fake
+
+    yield start
+    for fake in servers:
+        fake.stop()
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from collections import OrderedDict, deque
+
+# Recent back-and-forth per channel, sent to Gemini as real multi-turn
+# "contents" so people don't have to repeat themselves every mention.
+#
+# Everything is bounded: MAX_EXCHANGES per channel, MAX_TURN_CHARS per turn and
+# MAX_CHANNELS channels (least recently active dropped first), so memory stays
+# under roughly MAX_CHANNELS * MAX_EXCHANGES * 2 * MAX_TURN_CHARS characters no
+# matter how many channels the bot sees.
+
+MAX_EXCHANGES = 6        # user/Daniel exchanges remembered per channel
+MAX_TURN_CHARS = 500     # longer turns are cut down before being remembered
+MAX_CHANNELS = 1000
+IDLE_SECONDS = 30 * 60   # channels quiet for this long are forgotten
+
+class ConversationMemory:
+    """
+    Per-channel ring buffers of recent turns. Not thread-safe; the Discord bot
+    only touches it from the event loop.
+    """
+
+    def __init__(self, max_exchanges=MAX_EXCHANGES, max_turn_chars=MAX_TURN_CHARS,
+                 max_channels=MAX_CHANNELS, idle_seconds=IDLE_SECONDS):
+        self.max_exchanges = max_exchanges
+        self.max_turn_chars = max_turn_chars
+        self.max_channels = max_channels
+        self.idle_seconds = idle_seconds
+        self._channels = OrderedDict()  # channel id -> (last active, deque of (role, text)), least recent first
+
+    def __len__(self):
+        return len(self._channels)
+
+    def contents(self, channel_id) -> list:
+        """
+        The channel's remembered turns in Gemini's contents format, oldest
+        first. Empty if the channel has nothing (or has gone idle).
+        """
+        entry = self._channels.get(channel_id)
+        if entry is None or time.time() - entry[0] > self.idle_seconds:
+            return []
+        return [{"role": role, "parts": [{"text": text}]} for role, text in entry[1]]
+
+    def record(self, channel_id, user_text: str, reply_text: str):
+        """Remembers one exchange, evicting the oldest turns and channels as needed."""
+        entry = self._channels.pop(channel_id, None)
+        turns = entry[1] if entry is not None else deque(maxlen=2 * self.max_exchanges)
+        turns.append(("user", user_text[:self.max_turn_chars]))
+        turns.append(("model", reply_text[:self.max_turn_chars]))
+        self._channels[channel_id] = (time.time(), turns)
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+
+    def sweep(self) -> int:
+        """Forgets channels idle for longer than idle_seconds; returns how many."""
+        cutoff = time.time() - self.idle_seconds
+        removed = 0
+        # Least recently active first, so stop at the first channel still in use
+        while self._channels:
+            channel_id, (last_active, _) = next(iter(self._channels.items()))
+            if last_active > cutoff:
+                break
+            del self._channels[channel_id]
+            removed += 1
+        return removed
+
+    def save(self, path: str):
+        """Snapshots every channel to path as JSON lines, replacing it atomically."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for channel_id, (last_active, turns) in self._channels.items():
+                f.write(json.dumps({"channel": channel_id, "last_active": last_active, "turns": list(turns)}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """
+        Restores a snapshot written by save, skipping channels that have gone
+        idle since. Returns how many channels were restored.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                turns = deque((tuple(turn) for turn in record["turns"]), maxlen=2 * self.max_exchanges)
+                self._channels[record["channel"]] = (record["last_active"], turns)
+                self._channels.move_to_end(record["channel"])
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+        self.sweep()
+        return len(self._channels)
@@ -0,0 +1,417 @@
+import json
+import os
+import random
+import sys
+import threading
+
+from metrics import METRICS
+
+# What chat_with_daniel_rest.py and discord_daniel_boy.py share: the Gemini
+# endpoints, the few-shot pairs and retrieval index, the reply cache, the quota
+# limiter, prompt building and the request itself.
+#
+# Importing this does no work. The API key is read and the pairs, index, cache
+# and limiter are opened the first time something needs them; entry points call
+# preload() at startup so a missing dataset still fails right away. gemini_client
+# (and with it requests) is only imported once the first request is sent.
+# DANIEL_PROMPT_BUDGET is checked the same way, by preload() or the first prompt.
+
+MODEL = "gemini-1.5-pro"  # Or "gemini-2.0-flash", etc.
+API_BASE = "https://generativelanguage.googleapis.com/v1/models"
+RANDOM_EXAMPLES = 2  # of the k examples, how many stay random for variety
+SHED_REPLY = "Daniel's swamped rn, try again in a sec"
+CACHE_MAX_WORDS = 3  # queries this short ("hi", "lol", "yo daniel") use the cache even mid-conversation
+
+def require_env(name: str) -> str:
+    """Returns the environment variable, or explains how to set it and exits."""
+    value = os.environ.get(name)
+    if not value:
+        print(f"❗ Error: {name} environment variable not set.")
+        print("Please set it using:")
+        print(f"  Windows CMD: set {name}=YOUR_{name}_HERE")
+        print(f"  PowerShell: $env:{name}='YOUR_{name}_HERE'")
+        print(f"  Linux/macOS Bash: export {name}='YOUR_{name}_HERE'")
+        sys.exit(1)
+    return value
+
+def load_pairs():
+    """
+    Opens the few-shot pairs, preferring the memory-mapped daniel_pairs.bin
+    (build_pairs.py --store) over the JSON. Exits with an explanation if
+    neither can be read.
+    """
+    from pair_store import PairStore, open_pairs
+    try:
+        pairs = open_pairs()
+    except FileNotFoundError:
+        print("❗ Error: daniel_pairs_by_channel.json not found in the current directory.")
+        print("Please make sure 'daniel_pairs_by_channel.json' is in the same folder as your script.")
+        sys.exit(1)
+    except json.JSONDecodeError:
+        print("❗ Error: Could not decode daniel_pairs_by_channel.json. Check its JSON format.")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"❗ Error: Could not open daniel_pairs.bin ({e}). Rebuild it with: python build_pairs.py --store")
+        sys.exit(1)
+    source = "daniel_pairs.bin" if isinstance(pairs, PairStore) else "daniel_pairs_by_channel.json"
+    print(f"DEBUG: Loaded {len(pairs)} pairs from {source}.")
+    return pairs
+
+def load_index(n_pairs: int):
+    """
+    Opens the optional retrieval index (build_pairs.py --index), which picks the
+    examples most similar to the user's message instead of purely random ones.
+    """
+    from pair_index import open_index
+    try:
+        index = open_index(n_pairs)
+    except ValueError as e:
+        print(f"❗ Warning: Could not open daniel_pairs.idx ({e}). Using random examples.")
+        return None
+    if index is not None:
+        print("DEBUG: Using retrieval index daniel_pairs.idx for examples.")
+    return index
+
+def load_prompt_builder(persona: str):
+    """
+    Makes the PromptBuilder for persona within DANIEL_PROMPT_BUDGET, or
+    explains what's wrong with the budget and exits.
+    """
+    from prompt_builder import PromptBuilder
+    try:
+        return PromptBuilder(persona)
+    except ValueError as e:
+        print(f"❗ Error: {e}.")
+        print("Please fix or unset it, e.g.:")
+        print("  Linux/macOS Bash: export DANIEL_PROMPT_BUDGET=6000")
+        sys.exit(1)
+
+_UNSET = object()
+
+class DanielCore:
+    """
+    One persona and generation config plus everything loaded lazily around
+    them. Thread-safe; the Discord bot calls ask() from its Gemini thread pool.
+    """
+
+    def __init__(self, persona: str, generation_config: dict, model: str = MODEL):
+        self.persona = persona
+        self.generation_config = generation_config
+        self.model = model
+        self._lock = threading.RLock()
+        self._endpoint = None
+        self._stream_endpoint = None
+        self._prompt_builder = _UNSET
+        self._pairs = _UNSET
+        self._index = _UNSET
+        self._cache = _UNSET
+        self._limiter = _UNSET
+
+    def _lazy(self, attr, factory):
+        value = getattr(self, attr)
+        if value is _UNSET:
+            with self._lock:
+                value = getattr(self, attr)
+                if value is _UNSET:
+                    value = factory()
+                    setattr(self, attr, value)
+        return value
+
+    # --- Endpoints (overridable, e.g. to point at fake_gemini.py) ---
+    def _url(self, method: str) -> str:
+        url = f"{API_BASE}/{self.model}:{method}key={require_env('GEMINI_API_KEY')}"
+        print(f"DEBUG: Using Gemini endpoint: {url}")
+        return url
+
+    @property
+    def endpoint(self) -> str:
+        if self._endpoint is None:
+            self._endpoint = self._url("generateContent?")
+        return self._endpoint
+
+    @endpoint.setter
+    def endpoint(self, url: str):
+        self._endpoint = url
+
+    @property
+    def stream_endpoint(self) -> str:
+        # Same model, streaming variant (server-sent events)
+        if self._stream_endpoint is None:
+            self._stream_endpoint = self._url("streamGenerateContent?alt=sse&")
+        return self._stream_endpoint
+
+    @stream_endpoint.setter
+    def stream_endpoint(self, url: str):
+        self._stream_endpoint = url
+
+    # --- Lazily opened resources ---
+    @property
+    def prompt_builder(self):
+        return self._lazy("_prompt_builder", lambda: load_prompt_builder(self.persona))
+
+    @property
+    def pairs(self):
+        return self._lazy("_pairs", load_pairs)
+
+    @property
+    def index(self):
+        return self._lazy("_index", lambda: load_index(len(self.pairs)))
+
+    @property
+    def cache(self):
+        """Optional reply cache for repeated messages; see response_cache.cache_from_env."""
+        def open_cache():
+            from response_cache import cache_from_env
+            cache = cache_from_env()
+            if cache is not None:
+                print(f"DEBUG: Response cache enabled ({os.environ['DANIEL_RESPONSE_CACHE']}).")
+            return cache
+        return self._lazy("_cache", open_cache)
+
+    @property
+    def limiter(self):
+        """Optional client-side quota (DANIEL_QUOTA_RPM / DANIEL_QUOTA_TPM); see rate_limiter.py."""
+        def open_limiter():
+            from rate_limiter import limiter_from_env
+            limiter = limiter_from_env()
+            if limiter is not None:
+                print(f"DEBUG: Quota limiter enabled ({', '.join(limiter.buckets)}).")
+            return limiter
+        return self._lazy("_limiter", open_limiter)
+
+    def preload(self):
+        """
+        Checks the prompt budget and opens the pairs and index now instead of
+        on the first message. The pairs and index are read-only (memory-mapped
+        when built with --store/--index), so processes forked afterwards share
+        them. The cache and limiter hold SQLite
+        connections, which mustn't cross a fork, so they stay lazy.
+        """
+        self.prompt_builder
+        self.pairs
+        self.index
+        return self
+
+    def close(self):
+        if self._cache not in (_UNSET, None):
+            print(f"DEBUG: Response cache stats: {self._cache.stats()}")
+            self._cache.close()
+
+    # --- Prompting ---
+    def select_examples(self, k: int = 8, query: str = None):
+        """
+        Selects k examples from the loaded list of pairs: the ones most similar
+        to query when the retrieval index is available, otherwise random ones.
+        """
+        pairs = self.pairs
+        num_examples = min(k, len(pairs))
+        if num_examples == 0:
+            print(f"❗ Warning: No examples available in daniel_pairs_by_channel.json.")
+            return []
+        if self.index is not None and query:
+            ids = self.index.select(query, num_examples, min(RANDOM_EXAMPLES, num_examples))
+            return [pairs[i] for i in ids]
+        return random.sample(pairs, num_examples)
+
+    def build_prompt(self, user_input: str, history=None):
+        """
+        Constructs a plain-text few-shot prompt for the model.
+        Includes the persona and relevant examples, kept within the prompt
+        budget (DANIEL_PROMPT_BUDGET characters) together with the channel
+        history. Returns (prompt, history), history cut down to the newest
+        turns that fit.
+        """
+        with METRICS.timer("select_examples"):
+            examples = self.select_examples(query=user_input)
+        if not examples:
+            print("❗ Warning: No examples loaded for prompt building. Daniel might respond more generically.")
+
+        history = history or []
+        with METRICS.timer("build_prompt"):
+            prompt, stats = self.prompt_builder.build(user_input, examples, history)
+        print(f"DEBUG: Prompt is {stats['chars']} chars (~{stats['est_tokens']} tokens), "
+              f"{stats['examples']} examples, {stats['skipped']} skipped for length, "
+              f"{stats['history_turns']} history turns, {stats['history_dropped']} dropped for length.")
+        return prompt, history[len(history) - stats["history_turns"]:]
+
+    def build_body(self, query: str, history=None) -> dict:
+        """
+        Request body for Gemini: the channel's earlier turns (if any) followed by
+        the few-shot prompt for this query.
+        """
+        prompt, history = self.build_prompt(query, history)
+        return {
+          "contents": history + [
+            { "role": "user", "parts": [{ "text": prompt }] }
+          ],
+          "generationConfig": self.generation_config
+        }
+
+    def admit_request(self, body: dict, priority: str) -> bool:
+        """
+        Waits for quota for body if the limiter is on. False means the request
+        should be shed; the token estimate is ~4 characters per token plus the
+        longest reply Daniel may give.
+        """
+        if self.limiter is None:
+            return True
+        chars = sum(len(part.get("text", "")) for content in body["contents"] for part in content["parts"])
+        return self.limiter.admit(chars // 4 + self.generation_config["maxOutputTokens"], priority)
+
+    def readmit_after_429(self, body: dict, priority: str):
+        """
+        gemini_client's on_rate_limit callback for body, or None without a
+        limiter. A 429 means the quota is spent whatever the buckets think, so
+        they're drained and the retry waits for quota like a new request
+        (or gives up if it would wait too long) instead of hammering the API.
+        """
+        if self.limiter is None:
+            return None
+
+        def on_rate_limit():
+            self.limiter.drain()
+            return self.admit_request(body, priority)
+        return on_rate_limit
+
+    # --- Failures ---
+    def request_error_reply(self, err) -> str:
+        """
+        Logs a failed Gemini request and returns what Daniel says instead.
+        """
+        import requests
+        METRICS.incr("errors")
+        if isinstance(err, requests.exceptions.HTTPError):
+            error_details = ""
+            try:
+                error_json = err.response.json()
+                error_message = error_json.get("error", {}).get("message", "No specific error message.")
+                error_details = f": {error_message}"
+            except json.JSONDecodeError:
+                error_details = f": {err.response.text}"
+            print(f"❗ HTTP Error {err.response.status_code}{error_details}")
+            if err.response.status_code == 429 and self.limiter is not None:
+                self.limiter.drain()  # the quota is spent even if our buckets didn't think so
+            return "Daniel is momentarily offline due to an API error. Try again later."
+        if isinstance(err, requests.exceptions.ConnectionError):
+            print(f"❗ Connection Error: {err}")
+            print("Check your internet connection or proxy settings.")
+            return "Daniel can't connect to the internet right now."
+        if isinstance(err, requests.exceptions.Timeout):
+            print(f"❗ Timeout Error: {err}")
+            print("The request took too long to respond.")
+            return "Daniel took too long to respond. Try again."
+        print(f"❗ An unexpected request error occurred: {err}")
+        return "Daniel encountered an unexpected issue."
+
+    @staticmethod
+    def no_candidates_reply(data: dict) -> str:
+        """
+        Logs why the model returned nothing and returns what Daniel says instead.
+        """
+        if "promptFeedback" in data:
+            safety_ratings = data["promptFeedback"].get("safetyRatings", [])
+            if safety_ratings:
+                blocked_categories = ", ".join([r['category'] for r in safety_ratings if r['probability'] in ['HIGH', 'MEDIUM']])
+                print(f"❗ Model blocked response due to safety settings: {blocked_categories}")
+                METRICS.incr("safety_blocks")
+                return "Daniel can't respond to that, it might violate safety guidelines."
+            else:
+                print("❗ No candidates returned and no specific safety feedback.")
+        else:
+            print("❗ No candidates returned from the model.")
+        METRICS.incr("empty_replies")
+        return "Daniel is drawing a blank. Try rephrasing?"
+
+    # --- Asking Daniel ---
+    def _cached(self, query: str, history):
+        # Repeated messages ("hi", "lol") can be answered from the cache's reply pool.
+        # Longer ones only when there's no conversation going that the reply should
+        # follow; a greeting doesn't need the context, and active channels are where
+        # the spam lands.
+        if self.cache is None:
+            return False, None
+        from response_cache import normalize_query
+        if history and len(normalize_query(query).split()) > CACHE_MAX_WORDS:
+            return False, None
+        cached = self.cache.get(query, self.generation_config)
+        METRICS.incr("cache_hits" if cached is not None else "cache_misses")
+        return True, cached
+
+    def ask(self, query: str, history=None, priority: str = "normal"):
+        """
+        Sends the constructed prompt to the Gemini API and returns (reply, ok).
+        ok is False when the reply is one of the canned fallbacks (an error, a
+        safety block, shed for quota) rather than something Daniel said.
+        history is earlier turns in Gemini's contents format; priority decides how
+        long it may wait for quota (see rate_limiter.MAX_WAIT).
+        """
+        import gemini_client
+        import requests
+
+        use_cache, cached = self._cached(query, history)
+        if cached is not None:
+            return cached, True
+
+        body = self.build_body(query, history)
+        if not self.admit_request(body, priority):
+            return SHED_REPLY, False
+
+        try:
+            # Pooled session with timeouts; retries 429/5xx (429s through the limiter) before raising HTTPError
+            data = gemini_client.post_json(self.endpoint, body, self.readmit_after_429(body, priority))
+        except requests.exceptions.RequestException as err:
+            return self.request_error_reply(err), False
+
+        cands = data.get("candidates", [])
+        if not cands:
+            return self.no_candidates_reply(data), False
+
+        reply = cands[0]["content"]["parts"][0]["text"]
+        if use_cache:
+            self.cache.put(query, self.generation_config, reply)
+        return reply, True
+
+    def ask_stream(self, query: str, history=None, priority: str = "normal"):
+        """
+        Like ask, but yields Daniel's response in (piece, ok) pairs as Gemini
+        streams it (streamGenerateContent), so it can be shown as it arrives.
+        A fallback reply comes as a single piece with ok False; a stream cut
+        off midway ends with an empty piece with ok False.
+        """
+        import gemini_client
+        import requests
+
+        use_cache, cached = self._cached(query, history)
+        if cached is not None:
+            yield cached, True
+            return
+
+        body = self.build_body(query, history)
+        if not self.admit_request(body, priority):
+            yield SHED_REPLY, False
+            return
+
+        pieces = []
+        last_event = {}
+        try:
+            for event in gemini_client.stream_json(self.stream_endpoint, body, self.readmit_after_429(body, priority)):
+                last_event = event
+                cands = event.get("candidates", [])
+                if not cands:
+                    continue
+                text = "".join(part.get("text", "") for part in cands[0].get("content", {}).get("parts", []))
+                if text:
+                    pieces.append(text)
+                    yield text, True
+        except requests.exceptions.RequestException as err:
+            if not pieces:
+                yield self.request_error_reply(err), False
+            else:
+                print(f"❗ Stream cut off after {len(pieces)} chunks: {err}")
+                yield "", False
+            return
+
+        if not pieces:
+            yield self.no_candidates_reply(last_event), False
+        elif use_cache:
+            self.cache.put(query, self.generation_config, "".join(pieces))
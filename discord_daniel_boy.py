@@ -1,211 +1,428 @@
+import argparse
+import asyncio
+import gc
 import os
-import json
-import random
-import requests
 import sys
-import discord # Import the discord.py library
-
-# --- 1) Configuration for Gemini API ---
-API_KEY = os.environ.get("GEMINI_API_KEY")
-if not API_KEY:
-    print("❗ Error: GEMINI_API_KEY environment variable not set.")
-    print("Please set it using:")
-    print("  Windows CMD: set GEMINI_API_KEY=YOUR_GEMINI_API_KEY_HERE")
-    print("  PowerShell: $env:GEMINI_API_KEY='YOUR_GEMINI_API_KEY_HERE'")
-    print("  Linux/macOS Bash: export GEMINI_API_KEY='YOUR_GEMINI_API_KEY_HERE'")
-    sys.exit(1)
-
-# The model to use for generating content (e.g., 'gemini-1.5-pro', 'gemini-2.0-flash', 'gemini-1.5-flash')
-MODEL = "gemini-1.5-pro" # You can change this based on your preference and availability
-ENDPOINT = (
-    f"https://generativelanguage.googleapis.com/"
-    f"v1/models/{MODEL}:generateContent?key={API_KEY}"
-)
-print(f"DEBUG: Using Gemini model: {MODEL}")
-print(f"DEBUG: Using Gemini endpoint: {ENDPOINT}")
-
-# --- 2) Load your few-shot dataset for Daniel's personality ---
-try:
-    with open("daniel_pairs_by_channel.json", encoding="utf-8") as f:
-        CHANNELS_DATA = json.load(f)
-    print(f"DEBUG: Loaded {len(CHANNELS_DATA)} pairs from daniel_pairs_by_channel.json.")
-except FileNotFoundError:
-    print("❗ Error: daniel_pairs_by_channel.json not found in the current directory.")
-    print("Please make sure 'daniel_pairs_by_channel.json' is in the same folder as your script.")
-    sys.exit(1)
-except json.JSONDecodeError:
-    print("❗ Error: Could not decode daniel_pairs_by_channel.json. Check its JSON format.")
-    sys.exit(1)
-except Exception as e:
-    print(f"❗ An unexpected error occurred during data loading: {e}")
-    sys.exit(1)
-
-# --- Daniel's Core AI Functions (Copied from your previous script) ---
-def select_examples(k: int = 8):
-    """
-    Selects k random examples from the loaded list of pairs.
-    """
-    num_examples = min(k, len(CHANNELS_DATA))
-    if num_examples == 0:
-        print(f"❗ Warning: No examples available in daniel_pairs_by_channel.json.")
-        return []
-    return random.sample(CHANNELS_DATA, num_examples)
-
-def build_prompt(user_input: str) -> str:
-    """
-    Constructs a plain-text few-shot prompt for the model.
-    Includes a system instruction for Daniel's persona and relevant examples.
-    """
-    # Refined system instruction for Daniel's persona
-    prompt = "You are Daniel. Reply exactly as Daniel would. You are allowed to curse. When ASKED about your interests (like games, anime, music, IT studies at CSUN, working at Lorelles Coffee Shop, or going to the gym. Your favorite manga is berserk), elaborate with detail and personal insight, but do NOT just bring up going to the gym, lorelle's coffee shop, or csun for literally no reason. Engage in thoughtful conversation, but don't force topics unless relevant to the user's query. Avoid using overly enthusiastic phrases like chefs kiss and stuff like that. remember youre like a 20 year old kind of nerdy guy whos and airhead and heavy into meme/internet culture, but not corny like reddit dialogue. talk normalish. You also don't play any riot games games ie. league and valorant. \n\n"
-
-    examples = select_examples()
-    if not examples:
-        print("❗ Warning: No examples loaded for prompt building. Daniel might respond more generically.")
-
-    for ex in examples:
-        prompt += f"User: {ex['user']}\nDaniel: {ex['daniel']}\n"
-    
-    prompt += f"User: {user_input}\nDaniel:"
-    return prompt
-
-def ask_daniel(query: str) -> str:
-    """
-    Sends the constructed prompt to the Gemini API and returns Daniel's response.
-    """
-    body = {
-      "contents": [
-        { "parts": [{ "text": build_prompt(query) }] }
-      ],
-      "generationConfig": {
-        "temperature":     0.6,   # Adjust for creativity (0.0-1.0)
-        "maxOutputTokens": 300,   # Max length of Daniel's response
-        "topP":            0.5,
-        "topK":            40
-      }
-    }
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from conversation_memory import ConversationMemory
+from daniel_core import DanielCore, require_env
+from metrics import METRICS
 
-    try:
-        resp = requests.post(ENDPOINT, json=body)
-        resp.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
+# discord.py is only imported by make_client(), so importing this module stays
+# cheap (for the benchmark, or a supervisor checking the file) and does no work.
+
+# --- Daniel's persona; prompting, the dataset and Gemini live in daniel_core ---
+# Refined system instruction for Daniel's persona
+PERSONA = "You are Daniel. Reply exactly as Daniel would. You are allowed to curse. When ASKED about your interests (like games, anime, music, IT studies at CSUN, working at Lorelles Coffee Shop, or going to the gym. Your favorite manga is berserk), elaborate with detail and personal insight, but do NOT just bring up going to the gym, lorelle's coffee shop, or csun for literally no reason. Engage in thoughtful conversation, but don't force topics unless relevant to the user's query. Avoid using overly enthusiastic phrases like chefs kiss and stuff like that. remember youre like a 20 year old kind of nerdy guy whos and airhead and heavy into meme/internet culture, but not corny like reddit dialogue. talk normalish. You also don't play any riot games games ie. league and valorant. \n\n"
+
+GENERATION_CONFIG = {
+    "temperature":     0.6,   # Adjust for creativity (0.0-1.0)
+    "maxOutputTokens": 300,   # Max length of Daniel's response
+    "topP":            0.5,
+    "topK":            40
+}
+
+# Nothing is loaded until main() calls CORE.preload() (or the first mention needs it)
+CORE = DanielCore(PERSONA, GENERATION_CONFIG)
+
+# --- Keeping Gemini calls off the event loop ---
+# CORE.ask blocks on HTTP for seconds at a time. Running it in a bounded thread pool
+# keeps heartbeats and other channels flowing while a reply is generated; mentions beyond
+# the limit wait their turn. Set DANIEL_MAX_CONCURRENCY to tune it.
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("DANIEL_MAX_CONCURRENCY", "8"))
+GEMINI_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="gemini")
+
+async def ask_daniel_async(query: str, history=None, priority: str = "normal"):
+    """
+    Awaitable CORE.ask for use inside Discord event handlers; returns (reply, ok).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(GEMINI_EXECUTOR, CORE.ask, query, history, priority)
+
+# --- Streaming replies ---
+# With DANIEL_STREAM=1 the bot posts the first chunk of a reply as soon as it arrives and
+# then edits the message as more text streams in. Edits are batched to one per
+# EDIT_INTERVAL seconds because Discord rate-limits message edits per channel.
+STREAM_REPLIES = os.environ.get("DANIEL_STREAM") == "1"
+EDIT_INTERVAL = 1.0
+
+async def stream_daniel(query: str, history=None, priority: str = "normal"):
+    """
+    Async iterator over CORE.ask_stream's (chunk, ok) pairs. The blocking HTTP stream is
+    read on the Gemini thread pool and handed back to the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def pump():
         try:
-            error_json = http_err.response.json()
-            error_message = error_json.get("error", {}).get("message", "No specific error message.")
-            error_details = f": {error_message}"
-        except json.JSONDecodeError:
-            error_details = f": {http_err.response.text}"
-        print(f"❗ HTTP Error {resp.status_code}{error_details}")
-        return "Daniel is momentarily offline due to an API error. Try again later."
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"❗ Connection Error: {conn_err}")
-        print("Check your internet connection or proxy settings.")
-        return "Daniel can't connect to the internet right now."
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"❗ Timeout Error: {timeout_err}")
-        print("The request took too long to respond.")
-        return "Daniel took too long to respond. Try again."
-    except requests.exceptions.RequestException as req_err:
-        print(f"❗ An unexpected request error occurred: {req_err}")
-        return "Daniel encountered an unexpected issue."
-
-    cands = resp.json().get("candidates", [])
-    if not cands:
-        if "promptFeedback" in resp.json():
-            safety_ratings = resp.json()["promptFeedback"].get("safetyRatings", [])
-            if safety_ratings:
-                blocked_categories = ", ".join([r['category'] for r in safety_ratings if r['probability'] in ['HIGH', 'MEDIUM']])
-                print(f"❗ Model blocked response due to safety settings: {blocked_categories}")
-                return "Daniel can't respond to that, it might violate safety guidelines."
-            else:
-                print("❗ No candidates returned and no specific safety feedback.")
+            for chunk in CORE.ask_stream(query, history, priority):
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    reader = loop.run_in_executor(GEMINI_EXECUTOR, pump)
+    while True:
+        chunk = await queue.get()
+        if chunk is done:
+            break
+        yield chunk
+    await reader  # re-raises anything pump hit
+
+async def send_streamed_reply(channel, prefix: str, query: str, history=None, priority: str = "normal"):
+    """
+    Sends Daniel's answer to channel after prefix (the mentions), posting the
+    first chunk right away and editing the rest in. Returns (full reply text,
+    ok), ok being False for fallbacks and cut-off streams.
+    """
+    text = ""
+    shown = ""
+    sent = None
+    last_edit = 0.0
+    ok = True
+    started = time.perf_counter()
+    async for chunk, chunk_ok in stream_daniel(query, history, priority):
+        ok = ok and chunk_ok
+        if not chunk:
+            continue
+        text += chunk
+        if sent is None:
+            METRICS.observe("first_chunk", time.perf_counter() - started)
+            sent = await channel.send(prefix + text)
+            shown, last_edit = text, time.monotonic()
+        elif time.monotonic() - last_edit >= EDIT_INTERVAL:
+            await sent.edit(content=prefix + text)
+            shown, last_edit = text, time.monotonic()
+    if sent is None:
+        text, ok = "Daniel is drawing a blank. Try rephrasing?", False
+        await channel.send(prefix + text)
+    elif shown != text:
+        await sent.edit(content=prefix + text)
+    return text, ok
+
+# --- Coalescing and fair scheduling of mentions ---
+# Mentions in the same channel that arrive within COALESCE_WINDOW seconds of the first
+# are answered together with one generation. Ready batches are served round-robin by
+# guild, so one busy server can't starve the rest, and each user can only have
+# USER_MAX_PENDING mentions waiting at a time, so one spammer can't flood the queue.
+# Mentions past that are dropped with a SLOW_DOWN_REPLY, sent once until the user's
+# queue drains so the bot doesn't spam back.
+COALESCE_WINDOW = float(os.environ.get("DANIEL_COALESCE_WINDOW", "1.5"))
+USER_MAX_PENDING = 2
+SLOW_DOWN_REPLY = "slow down bro, still on your last ones"
+
+def combine_mentions(batch) -> str:
+    """
+    Turns a batch of (message, query) mentions into one query for Daniel.
+    """
+    if len(batch) == 1:
+        return batch[0][1]
+    lines = [f"{message.author.display_name}: {query}" for message, query in batch]
+    return "(A few people pinged you at once, answer all of them in one message)\n" + "\n".join(lines)
+
+class MentionScheduler:
+    def __init__(self, window: float = COALESCE_WINDOW, workers: int = MAX_CONCURRENT_REQUESTS):
+        self.window = window
+        self.workers = workers
+        self.pending = {}            # channel id -> mentions still inside their window
+        self.queues = OrderedDict()  # guild key -> deque of ready batches, in round-robin order
+        self.ready = None            # one token per ready batch
+        self.user_pending = Counter()
+        self.warned = set()          # users already told to slow down while at the cap
+        self._tasks = []
+
+    def _start(self):
+        self.ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, message, query: str) -> bool:
+        """
+        Queues a mention to be answered. Returns False if it was dropped
+        because its author already has too many mentions waiting; the first
+        such drop gets a SLOW_DOWN_REPLY.
+        """
+        if not self._tasks:
+            self._start()
+        METRICS.incr("mentions")
+        if self.user_pending[message.author.id] >= USER_MAX_PENDING:
+            print(f"DEBUG: Dropping mention from '{message.author}', {USER_MAX_PENDING} already pending.")
+            METRICS.incr("dropped_mentions")
+            if message.author.id not in self.warned:
+                self.warned.add(message.author.id)
+                await message.channel.send(f"{message.author.mention} {SLOW_DOWN_REPLY}")
+            return False
+        self.user_pending[message.author.id] += 1
+
+        batch = self.pending.get(message.channel.id)
+        if batch is not None:
+            batch.append((message, query))
+            return True
+        self.pending[message.channel.id] = [(message, query)]
+        asyncio.get_running_loop().call_later(self.window, self._close_window, message)
+        return True
+
+    def _close_window(self, message):
+        batch = self.pending.pop(message.channel.id)
+        guild = message.guild.id if message.guild is not None else ("dm", message.channel.id)
+        self.queues.setdefault(guild, deque()).append((time.monotonic(), batch))
+        self.ready.put_nowait(None)
+
+    def _next_batch(self):
+        guild, batches = next(iter(self.queues.items()))
+        queued_at, batch = batches.popleft()
+        METRICS.observe("queueing", time.monotonic() - queued_at)
+        if batches:
+            self.queues.move_to_end(guild)  # back of the line for this guild
         else:
-            print("❗ No candidates returned from the model.")
-        return "Daniel is drawing a blank. Try rephrasing?"
-    
-    return cands[0]["content"]["parts"][0]["text"]
+            del self.queues[guild]
+        return batch
+
+    async def _worker(self):
+        while True:
+            await self.ready.get()
+            batch = self._next_batch()
+            try:
+                await answer_mentions(batch)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                for message, _ in batch:
+                    self.user_pending[message.author.id] -= 1
+                    if self.user_pending[message.author.id] <= 0:
+                        del self.user_pending[message.author.id]
+                        self.warned.discard(message.author.id)
+
+async def answer_mentions(batch):
+    """
+    Answers a batch of mentions from one channel with a single reply.
+    """
+    channel = batch[0][0].channel
+    mentions = []
+    for message, _ in batch:
+        if message.author.mention not in mentions:
+            mentions.append(message.author.mention)
+    prefix = " ".join(mentions) + " "
+    query = combine_mentions(batch)
+    if len(batch) > 1:
+        print(f"DEBUG: Answering {len(batch)} mentions in channel {channel.id} with one generation.")
+
+    history = MEMORY.contents(channel.id)
+    # When quota is short, batches (several people waiting) get to wait longest
+    # and throwaway one-liners ("lol", "yo daniel") are shed first
+    if len(batch) > 1:
+        priority = "high"
+    elif len(query.split()) <= 2:
+        priority = "low"
+    else:
+        priority = "normal"
+
+    # Show 'typing...' status while processing the request
+    async with channel.typing():
+        if STREAM_REPLIES:
+            # Post the reply as it streams in instead of waiting for all of it
+            with METRICS.timer("generate_and_send"):
+                daniel_response, ok = await send_streamed_reply(channel, prefix, query, history, priority)
+        else:
+            # Ask Daniel off the event loop so the bot stays responsive meanwhile
+            with METRICS.timer("generate"):
+                daniel_response, ok = await ask_daniel_async(query, history, priority)
+
+            # Send Daniel's response back to the channel
+            with METRICS.timer("discord_send"):
+                await channel.send(prefix + daniel_response)
+        print(f"Daniel responded: '{daniel_response}'")
+    # Canned fallbacks ("Daniel is momentarily offline…") and cut-off replies aren't
+    # things Daniel said; remembering them would have the model repeat them
+    if ok:
+        MEMORY.record(channel.id, query, daniel_response)
+    METRICS.incr("batches")
+
+SCHEDULER = MentionScheduler()
+
+# --- Per-channel conversation memory ---
+# Recent exchanges per channel are sent along as multi-turn context. The memory is
+# bounded (see conversation_memory.py), swept for idle channels every SWEEP_INTERVAL
+# seconds, and snapshotted to MEMORY_FILE then and on shutdown so restarts keep it.
+MEMORY_FILE = os.environ.get("DANIEL_MEMORY_FILE", "conversation_memory.jsonl")
+SWEEP_INTERVAL = 5 * 60
+MEMORY = ConversationMemory()
+MEMORY_SWEEPER = None
+
+# --- Metrics ---
+# Set DANIEL_METRICS_PORT to expose stage timings and counters at
+# http://127.0.0.1:PORT/metrics (Prometheus text format). They're also appended to
+# DANIEL_METRICS_DUMP as JSON lines on shutdown.
+METRICS_PORT = os.environ.get("DANIEL_METRICS_PORT")
+METRICS_DUMP = os.environ.get("DANIEL_METRICS_DUMP", "daniel_metrics.jsonl")
+
+async def sweep_memory():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        removed = MEMORY.sweep()
+        if removed:
+            print(f"DEBUG: Forgot {removed} idle channels.")
+        MEMORY.save(MEMORY_FILE)
 
 # --- Discord Bot Setup ---
-# Get your Discord bot token - MUST be set as an environment variable
-DISCORD_BOT_TOKEN = os.environ.get("DISCORD_BOT_TOKEN")
-if not DISCORD_BOT_TOKEN:
-    print("❗ Error: DISCORD_BOT_TOKEN environment variable not set.")
-    print("Please set it using:")
-    print("  Windows CMD: set DISCORD_BOT_TOKEN=YOUR_DISCORD_BOT_TOKEN_HERE")
-    print("  PowerShell: $env:DISCORD_BOT_TOKEN='YOUR_DISCORD_BOT_TOKEN_HERE'")
-    print("  Linux/macOS Bash: export DISCORD_BOT_TOKEN='YOUR_DISCORD_BOT_TOKEN_HERE'")
-    sys.exit(1)
-
-# Set up Discord intents - crucial for receiving messages
-# The 'message_content' intent is privileged and must be enabled in Discord Developer Portal
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True # Optional: if you need info about server members later
-
-client = discord.Client(intents=intents)
-
-@client.event
-async def on_ready():
-    """Called when the bot successfully connects to Discord."""
-    print(f'🤖 Logged in as {client.user} (ID: {client.user.id})')
-    print('Bot is ready to receive commands!')
-    # Set the bot's activity/status
-    await client.change_presence(activity=discord.Game(name="Chatting with Daniel"))
-
-@client.event
-async def on_message(message):
-    """Called when a message is sent in any channel the bot can see."""
-    # Ignore messages sent by the bot itself to prevent infinite loops
-    if message.author == client.user:
-        return
-
-    # Check if the bot was mentioned in the message
-    # message.clean_content removes mentions from the text
-    if client.user.mentioned_in(message):
-        # Extract the part of the message after the bot's mention
-        user_query = message.clean_content.replace(f'<@!{client.user.id}>', '').strip()
-
-        if not user_query: # If the user just mentioned the bot without a question
-            await message.channel.send(f"Yes, {message.author.mention}? What do you need?")
+def make_client(shard_id=None, shard_count=None):
+    """
+    Creates the Discord client with its event handlers. With shard_id and
+    shard_count it only connects the guilds Discord assigns to that shard.
+    """
+    import discord
+
+    # Set up Discord intents - crucial for receiving messages
+    # The 'message_content' intent is privileged and must be enabled in Discord Developer Portal
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True # Optional: if you need info about server members later
+
+    client = discord.Client(intents=intents, shard_id=shard_id, shard_count=shard_count)
+
+    @client.event
+    async def on_ready():
+        """Called when the bot successfully connects to Discord."""
+        print(f'🤖 Logged in as {client.user} (ID: {client.user.id})' + (f", shard {shard_id}" if shard_count else ""))
+        print('Bot is ready to receive commands!')
+        # Set the bot's activity/status
+        await client.change_presence(activity=discord.Game(name="Chatting with Daniel"))
+        # on_ready fires again after reconnects; only start the memory sweeper once
+        global MEMORY_SWEEPER
+        if MEMORY_SWEEPER is None:
+            MEMORY_SWEEPER = asyncio.create_task(sweep_memory())
+
+    @client.event
+    async def on_message(message):
+        """Called when a message is sent in any channel the bot can see."""
+        # Ignore messages sent by the bot itself to prevent infinite loops
+        if message.author == client.user:
             return
 
-        print(f"User '{message.author}' ({message.author.id}) mentioned Daniel with: '{user_query}'")
+        # Check if the bot was mentioned in the message
+        # message.clean_content removes mentions from the text
+        if client.user.mentioned_in(message):
+            # Extract the part of the message after the bot's mention
+            user_query = message.clean_content.replace(f'<@!{client.user.id}>', '').strip()
 
-        # Show 'typing...' status while processing the request
-        async with message.channel.typing():
-            # Call your ask_daniel function with the user's query
-            daniel_response = ask_daniel(user_query)
-            
-            # Send Daniel's response back to the channel
-            await message.channel.send(f"{message.author.mention} {daniel_response}")
-            print(f"Daniel responded: '{daniel_response}'")
-
-    # Optional: You can also add a prefix command here if you prefer (e.g., !daniel what's up?)
-    # prefix = "!daniel"
-    # if message.content.lower().startswith(prefix):
-    #     user_query = message.content[len(prefix):].strip()
-    #     if not user_query:
-    #         await message.channel.send(f"Yes, {message.author.mention}? What do you need?")
-    #         return
-    #     print(f"User '{message.author}' used prefix: '{user_query}'")
-    #     async with message.channel.typing():
-    #         daniel_response = ask_daniel(user_query)
-    #         await message.channel.send(f"{message.author.mention} {daniel_response}")
-    #     print(f"Daniel responded: '{daniel_response}'")
+            if not user_query: # If the user just mentioned the bot without a question
+                await message.channel.send(f"Yes, {message.author.mention}? What do you need?")
+                return
 
+            print(f"User '{message.author}' ({message.author.id}) mentioned Daniel with: '{user_query}'")
 
-# --- Run the Bot ---
-if __name__ == "__main__":
+            # Coalesced with other mentions in this channel and answered by the scheduler
+            # (which tells the user to slow down if they already have too many waiting)
+            await SCHEDULER.submit(message, user_query)
+
+    return client
+
+def run_shard(token: str, shard_id=None, shard_count=None) -> int:
+    """
+    Runs one bot process until Discord disconnects it or it's interrupted;
+    returns the exit code. Each shard keeps its own memory snapshot and
+    metrics port (DANIEL_METRICS_PORT + shard_id).
+    """
+    global MEMORY_FILE
+    if shard_count:
+        MEMORY_FILE = f"{MEMORY_FILE}.shard{shard_id}"
+    try:
+        print(f"DEBUG: Restored conversation memory for {MEMORY.load(MEMORY_FILE)} channels.")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❗ Warning: Could not restore conversation memory from {MEMORY_FILE}: {e}")
+    if METRICS_PORT:
+        port = int(METRICS_PORT) + (shard_id or 0)
+        METRICS.serve(port)
+        print(f"DEBUG: Serving metrics on http://127.0.0.1:{port}/metrics")
+
+    import discord
     try:
-        client.run(DISCORD_BOT_TOKEN)
+        make_client(shard_id, shard_count).run(token)
+        return 0
     except discord.LoginFailure:
         print("❗ Error: Invalid Discord Bot Token. Please check your DISCORD_BOT_TOKEN environment variable.")
+        return 1
+    except KeyboardInterrupt:
+        return 0
     except Exception as e:
         print(f"\n--- CRITICAL SCRIPT ERROR ---")
         print(f"An unhandled error occurred while running the Discord bot: {e}")
         import traceback
         traceback.print_exc()
+        return 1
     finally:
-        # This will keep the console open for debugging if the bot crashes
-        input("\nPress Enter to close the console...")
\ No newline at end of file
+        try:
+            MEMORY.save(MEMORY_FILE)
+            print(f"DEBUG: Saved conversation memory for {len(MEMORY)} channels to {MEMORY_FILE}.")
+        except OSError as e:
+            print(f"❗ Warning: Could not save conversation memory to {MEMORY_FILE}: {e}")
+        try:
+            METRICS.dump(METRICS_DUMP)
+        except OSError as e:
+            print(f"❗ Warning: Could not write metrics to {METRICS_DUMP}: {e}")
+        CORE.close()
+
+# Where forked shards keep their shared quota buckets when DANIEL_QUOTA_DB isn't set
+SHARD_QUOTA_DB = "daniel_quota.sqlite3"
+
+def run_shards(token: str, shard_count: int) -> int:
+    """
+    Forks one process per shard after the dataset is loaded, so they all share
+    its pages instead of each loading their own copy.
+    """
+    # Keep the preloaded objects out of the collector so it doesn't touch (and copy) their pages
+    gc.freeze()
+    children = {}
+    for shard_id in range(shard_count):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_shard(token, shard_id, shard_count)
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children[pid] = shard_id
+    print(f"DEBUG: Started {shard_count} shards: {sorted(children)}")
+
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except KeyboardInterrupt:
+            continue  # the shards got the Ctrl+C too; wait for them to save and exit
+        shard_id = children.pop(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if code:
+            print(f"❗ Shard {shard_id} exited with status {code}")
+            exit_code = 1
+    return exit_code
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Daniel Discord bot.")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("DANIEL_SHARDS", "1")),
+                        help="run N shard processes forked from one preloaded process (default: DANIEL_SHARDS or 1)")
+    args = parser.parse_args(argv)
+
+    # Get your Discord bot token - MUST be set as an environment variable
+    token = require_env("DISCORD_BOT_TOKEN")
+    require_env("GEMINI_API_KEY")
+    CORE.preload()
+
+    if args.shards > 1:
+        if not hasattr(os, "fork"):
+            print("❗ Error: --shards needs os.fork, which this platform doesn't have.")
+            return 1
+        if (os.environ.get("DANIEL_QUOTA_RPM") or os.environ.get("DANIEL_QUOTA_TPM")) and not os.environ.get("DANIEL_QUOTA_DB"):
+            # In-memory buckets would give every shard the whole quota
+            os.environ["DANIEL_QUOTA_DB"] = SHARD_QUOTA_DB
+            print(f"DEBUG: Sharing the Gemini quota between shards through {SHARD_QUOTA_DB}.")
+        return run_shards(token, args.shards)
+    return run_shard(token)
+
+# --- Run the Bot ---
+if __name__ == "__main__":
+    sys.exit(main())
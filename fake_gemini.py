@@ -0,0 +1,131 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Gemini generateContent / streamGenerateContent
+# endpoints, for benchmarking and trying the bots without an API key.
+# Point a bot's ENDPOINT at http://127.0.0.1:PORT/v1/models/fake:generateContent
+
+REPLY = "lmao yeah i was literally just thinking about that, anyway what's up"
+
+class FakeGemini:
+    """
+    Configurable fake server. latency is seconds before the response starts;
+    error_rate and rate_limit_rate are the fractions of requests answered
+    with a 500 or a 429 (with Retry-After: retry_after). cut_after drops
+    streamed responses after that many chunks, like a connection reset.
+    """
+
+    def __init__(self, port=0, latency=0.2, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, stream_chunks=5, chunk_delay=0.05, reply=REPLY, cut_after=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.chunk_delay = chunk_delay
+        self.reply = reply
+        self.cut_after = cut_after
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def url(self, stream=False):
+        method = "streamGenerateContent?alt=sse&key=fake" if stream else "generateContent?key=fake"
+        return f"http://127.0.0.1:{self.port}/v1/models/fake:{method}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-gemini", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+
+                roll = random.random()
+                if roll < fake.rate_limit_rate:
+                    return self._json(429, {"error": {"code": 429, "message": "Resource has been exhausted"}},
+                                      {"Retry-After": str(fake.retry_after)})
+                if roll < fake.rate_limit_rate + fake.error_rate:
+                    return self._json(500, {"error": {"code": 500, "message": "Internal error"}})
+
+                if "streamGenerateContent" in self.path:
+                    return self._stream()
+                return self._json(200, fake._response(fake.reply))
+
+            def _json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = fake.reply.split(" ")
+                step = max(1, len(words) // fake.stream_chunks)
+                for n, i in enumerate(range(0, len(words), step)):
+                    if n == fake.cut_after:
+                        self.close_connection = True  # no terminating chunk: the client sees a cut-off body
+                        return
+                    text = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+                    event = f"data: {json.dumps(fake._response(text))}\r\n\r\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def _response(text):
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Gemini server locally.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each response starts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--cut-after", type=int, default=None, help="cut streamed replies off after N chunks")
+    args = parser.parse_args(argv)
+
+    fake = FakeGemini(args.port, args.latency, args.error_rate, args.rate_limit_rate, args.retry_after,
+                      cut_after=args.cut_after)
+    print(f"🤖 Fake Gemini listening on {fake.url()}")
+    print(f"   streaming: {fake.url(stream=True)}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
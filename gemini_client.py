@@ -0,0 +1,128 @@
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+# Shared HTTP layer for both chat_with_daniel_rest.py and discord_daniel_boy.py.
+# One pooled keep-alive session per process, so consecutive messages reuse the
+# same TLS connection instead of handshaking every time.
+
+CONNECT_TIMEOUT = 5     # seconds to establish the connection
+READ_TIMEOUT = 60       # seconds to wait for the model between bytes
+MAX_RETRIES = 4         # retries on top of the first attempt
+BACKOFF_BASE = 1.0      # first retry waits up to this long, doubling each time
+BACKOFF_MAX = 30.0      # never sleep longer than this between attempts
+POOL_SIZE = 16          # keep-alive connections held open per host
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide pooled session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def _retry_after(resp):
+    """
+    Seconds the server asked us to wait, from a Retry-After header given
+    either as a number of seconds or as an HTTP date.
+    """
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries out so a burst of 429s doesn't retry in lockstep
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _post(url: str, body: dict, stream: bool = False, on_rate_limit=None):
+    """
+    POSTs body to url, retrying 429 and 5xx responses with jittered
+    exponential backoff and honoring Retry-After. Returns the successful
+    response or raises the usual requests exceptions (HTTPError once retries
+    run out, ConnectionError, Timeout) so callers can report them.
+
+    on_rate_limit, if given, is called on every 429 before retrying, so a
+    quota limiter can charge the retry too; if it returns False the 429 is
+    raised right away instead.
+    """
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        with METRICS.timer("http_total"):
+            resp = session.post(url, json=body, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=stream)
+        # requests' elapsed runs from sending the request to parsing the response headers
+        METRICS.observe("http_ttfb", resp.elapsed.total_seconds())
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            break
+        if resp.status_code == 429 and on_rate_limit is not None and not on_rate_limit():
+            break
+        METRICS.incr("retries")
+        delay = _retry_after(resp)
+        delay = _backoff(attempt) if delay is None else min(delay, BACKOFF_MAX)
+        print(f"❗ Gemini returned {resp.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+        resp.close()
+        time.sleep(delay)
+    resp.raise_for_status()
+    return resp
+
+def post_json(url: str, body: dict, on_rate_limit=None) -> dict:
+    """
+    POSTs body to url and returns the parsed JSON response, with the retries
+    described in _post.
+    """
+    resp = _post(url, body, on_rate_limit=on_rate_limit)
+    with METRICS.timer("json_parse"):
+        return resp.json()
+
+def iter_sse(lines):
+    """
+    Parses server-sent events from an iterable of text lines and yields each
+    event's data as parsed JSON.
+    """
+    data = []
+    for line in lines:
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
+
+def stream_json(url: str, body: dict, on_rate_limit=None):
+    """
+    POSTs body to a streaming (alt=sse) endpoint and yields each JSON event
+    as it arrives. Retries only happen before the stream starts; an error
+    mid-stream is raised to the caller.
+    """
+    resp = _post(url, body, stream=True, on_rate_limit=on_rate_limit)
+    with resp:
+        if resp.encoding is None:
+            resp.encoding = "utf-8"
+        yield from iter_sse(resp.iter_lines(decode_unicode=True))
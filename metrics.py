@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Process-wide timings and counters for the bot pipeline. Stage timings land in
+# summaries (p50/p95/p99 over the most recent SAMPLES_KEPT samples, plus an
+# all-time count and sum); everything else is a plain counter. serve() exposes
+# them in Prometheus text format, dump() writes them out as JSON lines.
+
+SAMPLES_KEPT = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+class _Summary:
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self):
+        self.samples = deque(maxlen=SAMPLES_KEPT)
+        self.count = 0
+        self.total = 0.0
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+class Metrics:
+    """
+    Thread-safe registry; the bot records from the event loop and from the
+    Gemini worker threads alike.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            summary = self._stages.get(stage)
+            if summary is None:
+                summary = self._stages[stage] = _Summary()
+            summary.samples.append(seconds)
+            summary.count += 1
+            summary.total += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Times the with-block into the given stage, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def incr(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {"count": s.count, "sum": s.total, **{f"p{int(q * 100)}": v for q, v in s.quantiles().items()}}
+                for stage, s in self._stages.items()
+            }
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [
+            "# HELP daniel_stage_seconds Time spent in each stage of answering a mention.",
+            "# TYPE daniel_stage_seconds summary",
+        ]
+        for stage, s in sorted(snap["stages"].items()):
+            for q in QUANTILES:
+                lines.append(f'daniel_stage_seconds{{stage="{stage}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'daniel_stage_seconds_sum{{stage="{stage}"}} {s["sum"]:.6f}')
+            lines.append(f'daniel_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        for counter, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE daniel_{counter}_total counter")
+            lines.append(f"daniel_{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Appends the current numbers to path as JSON lines, one per metric."""
+        snap = self.snapshot()
+        now = time.time()
+        with open(path, "a", encoding="utf-8") as f:
+            for stage, s in sorted(snap["stages"].items()):
+                f.write(json.dumps({"time": now, "stage": stage, **s}) + "\n")
+            for counter, value in sorted(snap["counters"].items()):
+                f.write(json.dumps({"time": now, "counter": counter, "value": value}) + "\n")
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serves render() on http://host:port/metrics from a daemon thread."""
+        # Imported here: http.server is slow to import and most runs never serve
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes every few seconds would drown the bot's own output
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+METRICS = Metrics()
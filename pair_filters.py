@@ -0,0 +1,162 @@
+import hashlib
+import re
+import struct
+from collections import Counter
+
+# Quality filters run over the pair rows build_pairs.py produces, one row at a
+# time, before anything is written out. Rows are (timestamp, channel_id, user,
+# daniel) tuples, optionally followed by their pair_features(). Each row is checked against the rules in order and dropped at
+# the first one it fails; counts says how many each rule removed.
+#
+# Near duplicates are found with MinHash over each side's word bigrams and LSH
+# banding: a pair is a near duplicate of an earlier one when, in some band, both
+# its user and its Daniel signature match that pair's. With NUM_BANDS bands of
+# BAND_ROWS hashes that catches pairs whose sides each share roughly 80% of
+# their bigrams. Only band keys are kept in memory, never the pairs themselves.
+#
+# Everything about a single pair that doesn't depend on the filter settings or
+# on the other pairs (lengths, link shares, the duplicate digest and band keys)
+# comes from pair_features(). That's the expensive part, so build_pairs.py stores
+# it with each export's cached rows and an incremental rebuild only replays the
+# rules and set lookups.
+
+MIN_CHARS = 2             # either side shorter than this is dropped ("k", ".")
+MAX_CHARS = 1000          # either side longer than this is dropped (copypastas, logs)
+MAX_URL_RATIO = 0.5       # drop a side that's mostly links (share of its characters)
+# Channels whose messages are bot traffic rather than conversation (mudae rolls)
+EXCLUDED_CHANNELS = {"1315858143040897054"}
+
+NUM_BANDS = 8
+BAND_ROWS = 4
+NEAR_DUP_MIN_SHINGLES = 4  # pairs with fewer bigrams in total are left to the exact check
+
+_URL = re.compile(r"https?://\S+")
+# "$wa", "!play ...", "/roll" and the like are commands for other bots
+_COMMAND = re.compile(r"^[$!/%;]\w")
+_NON_WORD = re.compile(r"[^\w\s]+")
+# One blake2b digest per shingle gives all NUM_BANDS * BAND_ROWS 16-bit hashes at once
+_LANES = struct.Struct(f"<{NUM_BANDS * BAND_ROWS}H")
+
+def url_ratio(text: str) -> float:
+    if not text:
+        return 0.0
+    return sum(len(m) for m in _URL.findall(text)) / len(text)
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _shingles(text: str) -> set:
+    words = _NON_WORD.sub(" ", text).split()
+    if len(words) < 2:
+        return set(words)  # "lol" still has to match "lol"
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def minhash(shingles: set) -> tuple:
+    """MinHash signature of a shingle set: the lane-wise minimum of their hashes."""
+    if not shingles:
+        return (0,) * (NUM_BANDS * BAND_ROWS)
+    hashes = [_LANES.unpack(hashlib.blake2b(s.encode("utf-8"), digest_size=_LANES.size).digest())
+              for s in shingles]
+    return tuple(map(min, zip(*hashes)))
+
+def band_keys(user_signature: tuple, daniel_signature: tuple) -> list:
+    """One key per band, equal only when both sides' bands are."""
+    return [hash((band, user_signature[band * BAND_ROWS:(band + 1) * BAND_ROWS],
+                  daniel_signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]))
+            for band in range(NUM_BANDS)]
+
+def dedup_keys(user_text: str, daniel_text: str, near_dup: bool = True):
+    """
+    (exact-duplicate digest, near-duplicate band keys) for a pair. The band
+    keys are None for pairs too short for the near-duplicate check, or when
+    near_dup is off.
+    """
+    user_norm, daniel_norm = _normalize(user_text), _normalize(daniel_text)
+    digest = int.from_bytes(hashlib.blake2b(f"{user_norm}\x00{daniel_norm}".encode("utf-8"), digest_size=8).digest(),
+                            "little")
+    keys = None
+    if near_dup:
+        user_shingles, daniel_shingles = _shingles(user_norm), _shingles(daniel_norm)
+        if len(user_shingles) + len(daniel_shingles) >= NEAR_DUP_MIN_SHINGLES:
+            keys = band_keys(minhash(user_shingles), minhash(daniel_shingles))
+    return digest, keys
+
+def _rule_features(user_text: str, daniel_text: str) -> list:
+    command = bool(_COMMAND.match(user_text) or _COMMAND.match(daniel_text))
+    return [command, len(user_text), len(daniel_text), url_ratio(user_text), url_ratio(daniel_text)]
+
+def pair_features(user_text: str, daniel_text: str) -> list:
+    """
+    Everything PairFilter needs to know about one pair, as a JSON-friendly
+    list: [bot command?, user length, Daniel length, user link share,
+    Daniel link share, duplicate digest, band keys or None].
+    """
+    return _rule_features(user_text, daniel_text) + list(dedup_keys(user_text, daniel_text))
+
+class PairFilter:
+    """
+    Streaming filter over pair rows. Keeps only an 8-byte digest per distinct
+    pair and NUM_BANDS ints per distinct longer pair, so it stays small next to
+    the pairs themselves.
+    """
+
+    def __init__(self, min_chars=MIN_CHARS, max_chars=MAX_CHARS, max_url_ratio=MAX_URL_RATIO,
+                 excluded_channels=EXCLUDED_CHANNELS, near_dup=True):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_url_ratio = max_url_ratio
+        self.excluded_channels = set(excluded_channels)
+        self.near_dup = near_dup
+        self.counts = Counter()
+        self.kept = 0
+        self._digests = set()
+        self._bands = set()
+
+    def reason(self, channel_id, user_text: str, daniel_text: str, features=None):
+        """
+        Returns the name of the first rule the pair fails, or None to keep it.
+        features is the pair's pair_features() if they were cached; otherwise
+        only as much as the rules get to is computed.
+        """
+        if channel_id in self.excluded_channels:
+            return "channel"
+        command, user_len, daniel_len, user_urls, daniel_urls = (
+            _rule_features(user_text, daniel_text) if features is None else features[:5])
+        if command:
+            return "bot_command"
+        for length in (user_len, daniel_len):
+            if not self.min_chars <= length <= self.max_chars:
+                return "length"
+        if user_urls > self.max_url_ratio or daniel_urls > self.max_url_ratio:
+            return "links"
+
+        digest, keys = dedup_keys(user_text, daniel_text, self.near_dup) if features is None else features[5:]
+        if digest in self._digests:
+            return "exact_duplicate"
+        self._digests.add(digest)
+
+        if self.near_dup and keys is not None:
+            if not self._bands.isdisjoint(keys):
+                return "near_duplicate"
+            self._bands.update(keys)
+        return None
+
+    def filter(self, rows):
+        """
+        Yields the rows that pass every rule, counting the ones that don't.
+        Rows may carry their pair_features() as a fifth field.
+        """
+        for row in rows:
+            reason = self.reason(row[1], row[2], row[3], row[4] if len(row) > 4 else None)
+            if reason is None:
+                self.kept += 1
+                yield row
+            else:
+                self.counts[reason] += 1
+
+    def report(self) -> str:
+        removed = sum(self.counts.values())
+        if not removed:
+            return f"🧹 Filters kept all {self.kept} pairs."
+        details = ", ".join(f"{name.replace('_', ' ')} {count}" for name, count in self.counts.most_common())
+        return f"🧹 Filters removed {removed} of {removed + self.kept} pairs ({details})."
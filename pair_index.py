@@ -0,0 +1,199 @@
+import argparse
+import heapq
+import itertools
+import math
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from collections import Counter
+
+from pair_store import is_stale
+
+# Hashed TF-IDF index over the "user" side of every pair, so the bots can pick
+# few-shot examples that look like the incoming message instead of random ones.
+#
+# Layout: header | idf (float32 per bucket) | bucket starts (uint32, buckets + 1)
+#         | posting doc ids (uint32) | posting weights (float32)
+# Each bucket's postings are sorted by weight, highest first, and capped at
+# MAX_POSTINGS so very common words can't make a query scan the whole corpus.
+MAGIC = b"DPI1"
+_HEADER = struct.Struct("<4sIII")  # magic, bucket count, doc count, total postings
+N_BUCKETS = 1 << 18
+MAX_POSTINGS = 4096
+
+DEFAULT_INDEX = "daniel_pairs.idx"
+
+_WORD = re.compile(r"\w+")
+
+def _tokens(text):
+    """Words plus adjacent word pairs, lowercased."""
+    words = _WORD.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def _bucket(token):
+    # crc32 rather than hash() so buckets agree across processes
+    return zlib.crc32(token.encode("utf-8")) & (N_BUCKETS - 1)
+
+def _term_counts(text):
+    return Counter(_bucket(token) for token in _tokens(text))
+
+def build_index(texts, path=DEFAULT_INDEX):
+    """
+    Builds the index over texts (the user side of each pair, in pair order)
+    and writes it to path. Returns the number of documents indexed.
+    """
+    # bucket -> (doc ids, term frequencies), as arrays to keep 1M-pair builds small
+    postings = {}
+    n_docs = 0
+    for doc, text in enumerate(texts):
+        for bucket, count in _term_counts(text).items():
+            plist = postings.get(bucket)
+            if plist is None:
+                plist = postings[bucket] = (array("I"), array("f"))
+            plist[0].append(doc)
+            plist[1].append(1.0 + math.log(count))
+        n_docs = doc + 1
+
+    idf = array("f", bytes(4 * N_BUCKETS))
+    for bucket, (docs, _) in postings.items():
+        idf[bucket] = math.log((n_docs + 1) / (len(docs) + 1)) + 1.0
+
+    # Cosine-normalize each document's tf-idf vector
+    norms = array("d", bytes(8 * n_docs))
+    for bucket, (docs, tfs) in postings.items():
+        w = idf[bucket]
+        for doc, tf in zip(docs, tfs):
+            norms[doc] += (tf * w) ** 2
+
+    starts = array("I", [0])
+    ids = array("I")
+    weights = array("f")
+    for bucket in range(N_BUCKETS):
+        plist = postings.pop(bucket, None)
+        if plist is not None:
+            w = idf[bucket]
+            scored = [(tf * w / math.sqrt(norms[doc]), doc) for doc, tf in zip(*plist)]
+            for weight, doc in heapq.nlargest(MAX_POSTINGS, scored):
+                ids.append(doc)
+                weights.append(weight)
+        starts.append(len(ids))
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, N_BUCKETS, n_docs, len(ids)))
+        for arr in (idf, starts, ids, weights):
+            if sys.byteorder != "little":
+                arr.byteswap()
+            arr.tofile(f)
+    return n_docs
+
+class PairIndex:
+    """
+    Memory-mapped view of an index written by build_index.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_buckets, self.n_docs, n_postings = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or n_buckets != N_BUCKETS:
+            raise ValueError(f"{path} is not a pair index (or was built with a different bucket count)")
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        self._idf = view[pos:pos + 4 * n_buckets].cast("f")
+        pos += 4 * n_buckets
+        self._starts = view[pos:pos + 4 * (n_buckets + 1)].cast("I")
+        pos += 4 * (n_buckets + 1)
+        self._ids = view[pos:pos + 4 * n_postings].cast("I")
+        pos += 4 * n_postings
+        self._weights = view[pos:pos + 4 * n_postings].cast("f")
+        if pos + 4 * n_postings != len(self._mm):
+            raise ValueError(f"{path} is truncated or corrupt")
+
+    def __len__(self):
+        return self.n_docs
+
+    def search(self, query, k=8):
+        """Returns the ids of the k pairs whose user message best matches query."""
+        scores = {}
+        for bucket, count in _term_counts(query).items():
+            q = (1.0 + math.log(count)) * self._idf[bucket]
+            start, end = self._starts[bucket], self._starts[bucket + 1]
+            for doc, weight in zip(self._ids[start:end], self._weights[start:end]):
+                scores[doc] = scores.get(doc, 0.0) + q * weight
+        return heapq.nlargest(k, scores, key=scores.__getitem__)
+
+    def select(self, query, k=8, n_random=0):
+        """
+        Top matches for query, with n_random of the k slots given to random
+        pairs for variety. Falls back to random pairs when nothing matches.
+        """
+        picked = self.search(query, k - n_random)
+        chosen = set(picked)
+        wanted = min(k, self.n_docs)
+        while len(picked) < wanted:
+            doc = random.randrange(self.n_docs)
+            if doc not in chosen:
+                chosen.add(doc)
+                picked.append(doc)
+        return picked
+
+def open_index(n_pairs, path=DEFAULT_INDEX, dataset="daniel_pairs_by_channel.json"):
+    """
+    Opens the index if there is one built for a dataset of n_pairs pairs and
+    not older than it. Returns None otherwise, so callers fall back to
+    random examples.
+    """
+    if not os.path.exists(path):
+        return None
+    if is_stale(path, dataset):
+        print(f"❗ Warning: {path} is older than {dataset}; rebuild with build_pairs.py --index. Using random examples.")
+        return None
+    index = PairIndex(path)
+    if len(index) != n_pairs:
+        print(f"❗ Warning: {path} covers {len(index)} pairs but {n_pairs} are loaded; rebuild with build_pairs.py --index. Using random examples.")
+        return None
+    return index
+
+def _synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(20000)]
+    # Zipf-ish word frequencies, like real chat
+    cum_weights = list(itertools.accumulate(1.0 / (r + 1) for r in range(len(vocab))))
+    for _ in range(n):
+        yield " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(2, 20)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark build and query latency of the pair index.")
+    parser.add_argument("sizes", nargs="*", type=int, default=[100_000, 1_000_000],
+                        help="numbers of synthetic pairs to index (default: 100000 1000000)")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    for n in args.sizes:
+        path = os.path.join(tempfile.gettempdir(), f"pair_index_bench_{n}.idx")
+        t0 = time.perf_counter()
+        build_index(_synthetic_texts(n), path)
+        build_s = time.perf_counter() - t0
+        index = PairIndex(path)
+        queries = list(_synthetic_texts(args.queries, seed=1))
+        latencies = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, 8)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{n:>9} pairs: build {build_s:.1f}s, query p50 {p50:.2f}ms, p95 {p95:.2f}ms")
+        del index
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
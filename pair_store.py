@@ -0,0 +1,115 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+
+# Layout: header | UTF-8 blob | offsets
+#   header  = magic, pair count, byte position of the offsets array
+#   offsets = 2 * count + 1 little-endian uint64 boundaries into the blob;
+#             pair i is blob[o[2i]:o[2i+1]] (user) and blob[o[2i+1]:o[2i+2]] (daniel)
+MAGIC = b"DPS1"
+_HEADER = struct.Struct("<4sQQ")
+_OFFSET = struct.Struct("<Q")
+
+DEFAULT_STORE = "daniel_pairs.bin"
+
+class PairStoreWriter:
+    """
+    Streams pairs into a store file. Only the offsets are kept in memory
+    (8 bytes per string); text goes straight to disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.f = open(self.tmp_path, "wb")
+        self.f.write(_HEADER.pack(MAGIC, 0, 0))
+        self.offsets = array("Q", [0])
+        self.count = 0
+
+    def add(self, user, daniel):
+        for text in (user, daniel):
+            data = text.encode("utf-8")
+            self.f.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+        self.count += 1
+
+    def close(self):
+        offsets_pos = self.f.tell()
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+        self.offsets.tofile(self.f)
+        self.f.seek(0)
+        self.f.write(_HEADER.pack(MAGIC, self.count, offsets_pos))
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            os.remove(self.tmp_path)
+
+class PairStore(Sequence):
+    """
+    Read-only, memory-mapped view of a pair store. Pairs are decoded only
+    when indexed, so random.sample(store, k) touches just k of them, and
+    every bot process mapping the same file shares its pages.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _HEADER.size:
+            raise ValueError(f"{path} is not a pair store (file too short)")
+        magic, self._count, self._offsets_pos = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a pair store (bad magic {magic!r})")
+        if self._offsets_pos + (2 * self._count + 1) * _OFFSET.size != len(self._mm):
+            raise ValueError(f"{path} is truncated or corrupt")
+
+    def __len__(self):
+        return self._count
+
+    def _text(self, n):
+        start, end = struct.unpack_from("<QQ", self._mm, self._offsets_pos + n * _OFFSET.size)
+        return self._mm[_HEADER.size + start:_HEADER.size + end].decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("pair index out of range")
+        return {"user": self._text(2 * i), "daniel": self._text(2 * i + 1)}
+
+    def close(self):
+        self._mm.close()
+
+def is_stale(path, dataset):
+    """True if dataset has been rewritten since path was built from it."""
+    try:
+        return os.stat(path).st_mtime_ns < os.stat(dataset).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+def open_pairs(store=DEFAULT_STORE, fallback="daniel_pairs_by_channel.json"):
+    """
+    Memory-maps the binary store when build_pairs.py --store has made one,
+    otherwise loads the JSON pairs the old way. A store older than the JSON
+    is left over from an earlier build and is ignored.
+    """
+    if os.path.exists(store):
+        if not is_stale(store, fallback):
+            return PairStore(store)
+        print(f"❗ Warning: {store} is older than {fallback}; loading the JSON. Rebuild with build_pairs.py --store.")
+    with open(fallback, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,94 @@
+import os
+
+# Keeps few-shot prompts bounded: a handful of huge Discord messages in the
+# sampled examples used to blow prompts (and time-to-first-token) up.
+
+CHARS_PER_TOKEN = 4  # rough average for English chat; good enough for budgeting
+DEFAULT_BUDGET = 6000    # characters, unless DANIEL_PROMPT_BUDGET says otherwise
+MAX_EXAMPLE_CHARS = 600  # skip any single example longer than this
+MIN_USER_CHARS = 200     # room always left for the user's message after the persona
+HISTORY_SHARE = 0.5      # most of the remaining room channel history may take from the examples
+_TURN = "User: \nDaniel:"
+
+def budget_from_env() -> int:
+    """
+    DANIEL_PROMPT_BUDGET in characters, or DEFAULT_BUDGET when it's unset.
+    Read when a builder is made rather than at import, so a bad value is
+    reported by the entry point instead of breaking the import.
+    """
+    setting = os.environ.get("DANIEL_PROMPT_BUDGET")
+    if not setting:
+        return DEFAULT_BUDGET
+    try:
+        return int(setting)
+    except ValueError:
+        raise ValueError(f"DANIEL_PROMPT_BUDGET must be a whole number of characters, not {setting!r}") from None
+
+class PromptBuilder:
+    """
+    Assembles "persona + examples + user turn" prompts within a character
+    budget. The persona prefix is fixed per bot, so it's stored once here
+    instead of being rebuilt every call.
+    """
+
+    def __init__(self, persona: str, budget: int = None, max_example_chars: int = MAX_EXAMPLE_CHARS):
+        if budget is None:
+            budget = budget_from_env()
+        minimum = len(persona) + len(_TURN) + MIN_USER_CHARS
+        if budget < minimum:
+            raise ValueError(f"prompt budget of {budget} characters is too small: the persona alone is "
+                             f"{len(persona)}; set DANIEL_PROMPT_BUDGET to at least {minimum}")
+        self.prefix = persona
+        self.budget = budget
+        self.max_example_chars = max_example_chars
+
+    def build(self, user_input: str, examples, history=None):
+        """
+        Returns (prompt, stats). history (earlier turns in Gemini's contents
+        format, sent alongside the prompt) counts against the same budget: the
+        oldest exchanges are dropped until it fits in HISTORY_SHARE of the room
+        left after the persona and user turn, and stats["history_turns"] says
+        how many of the newest turns to send. Examples then fill the rest in
+        order until the next one would go over budget; oversize ones are
+        skipped. The user's own message is always kept, cut down if it alone
+        exceeds the budget.
+        """
+        tail = f"User: {user_input}\nDaniel:"
+        room = self.budget - len(self.prefix)
+        if len(tail) > room:
+            keep = room - len(_TURN)  # at least MIN_USER_CHARS, checked in __init__
+            tail = f"User: {user_input[:keep]}\nDaniel:"
+        room -= len(tail)
+
+        history = history or []
+        sizes = [sum(len(part.get("text", "")) for part in turn["parts"]) for turn in history]
+        start, history_chars = 0, sum(sizes)
+        while history_chars > room * HISTORY_SHARE:
+            # Whole exchanges at a time, so what's left still opens with a user turn
+            history_chars -= sum(sizes[start:start + 2])
+            start += 2
+        room -= history_chars
+
+        parts = [self.prefix]
+        used = skipped = 0
+        for ex in examples:
+            part = f"User: {ex['user']}\nDaniel: {ex['daniel']}\n"
+            if len(part) > self.max_example_chars or len(part) > room:
+                skipped += 1
+                continue
+            parts.append(part)
+            room -= len(part)
+            used += 1
+        parts.append(tail)
+
+        prompt = "".join(parts)
+        chars = len(prompt) + history_chars
+        stats = {
+            "chars": chars,
+            "est_tokens": chars // CHARS_PER_TOKEN,
+            "examples": used,
+            "skipped": skipped,
+            "history_turns": max(len(history) - start, 0),
+            "history_dropped": min(start, len(history)),
+        }
+        return prompt, stats
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import METRICS
+
+# Client-side token buckets for the Gemini quota: one for requests per minute
+# and one for tokens per minute. Requests wait for room in both buckets. If the
+# predicted wait is longer than their priority allows, they're shed up front
+# instead of being sent just to come back as a 429.
+#
+# With a db_path the bucket state lives in SQLite and every update happens in a
+# BEGIN IMMEDIATE transaction, so all bot processes on the host share one quota.
+
+# How long a request may wait for quota before it's shed, by priority
+MAX_WAIT = {
+    "high": 20.0,
+    "normal": 8.0,
+    "low": 2.0,
+}
+
+class QuotaLimiter:
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, db_path: str = None):
+        # name -> (capacity, refill per second); a full minute of burst at most.
+        # A quota left as None isn't limited.
+        self.buckets = {}
+        if requests_per_minute:
+            self.buckets["requests"] = (requests_per_minute, requests_per_minute / 60.0)
+        if tokens_per_minute:
+            self.buckets["tokens"] = (tokens_per_minute, tokens_per_minute / 60.0)
+        self._lock = threading.Lock()
+        self._state = {}  # name -> (tokens, last refill time), when not using SQLite
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _settle(self, state, amounts, now):
+        """
+        Refills the buckets in state up to now and takes amounts from all of
+        them if every one has room. Returns 0 on success, otherwise how many
+        seconds until they would.
+        """
+        levels = {}
+        for name, (capacity, rate) in self.buckets.items():
+            tokens, updated = state.get(name, (capacity, now))
+            levels[name] = min(capacity, tokens + (now - updated) * rate)
+        wait = 0.0
+        for name, (capacity, rate) in self.buckets.items():
+            needed = min(amounts.get(name, 0), capacity)  # anything bigger than a bucket would never fit
+            if levels[name] < needed:
+                wait = max(wait, (needed - levels[name]) / rate)
+        for name in self.buckets:
+            if wait == 0.0:
+                levels[name] -= min(amounts.get(name, 0), self.buckets[name][0])
+            state[name] = (levels[name], now)
+        return wait
+
+    def _take(self, amounts) -> float:
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                return self._settle(self._state, amounts, now)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                state = {name: (tokens, updated)
+                         for name, tokens, updated in self._db.execute("SELECT name, tokens, updated FROM buckets")}
+                wait = self._settle(state, amounts, now)
+                self._db.executemany("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                                     [(name, tokens, updated) for name, (tokens, updated) in state.items()])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return wait
+
+    def admit(self, est_tokens: int, priority: str = "normal") -> bool:
+        """
+        Blocks until there's quota for one request of about est_tokens tokens
+        and takes it. Returns False right away if the wait would be longer
+        than the priority's MAX_WAIT; the caller should then not send it.
+        """
+        deadline = time.monotonic() + MAX_WAIT[priority]
+        while True:
+            wait = self._take({"requests": 1, "tokens": est_tokens})
+            if wait == 0.0:
+                METRICS.incr("admitted")
+                return True
+            if time.monotonic() + wait > deadline:
+                METRICS.incr("shed")
+                return False
+            time.sleep(wait)
+
+    def drain(self):
+        """
+        Empties every bucket, for when Gemini rate-limited us anyway: the
+        quota is evidently used up by something we didn't account for.
+        """
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                self._state = {name: (0.0, now) for name in self.buckets}
+            else:
+                self._db.executemany("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, 0, ?)",
+                                     [(name, now) for name in self.buckets])
+
+def limiter_from_env():
+    """
+    DANIEL_QUOTA_RPM and DANIEL_QUOTA_TPM set the quota to stay under; with
+    neither set there's no limiter. DANIEL_QUOTA_DB is an optional SQLite file
+    shared by every bot process on the host.
+    """
+    rpm = os.environ.get("DANIEL_QUOTA_RPM")
+    tpm = os.environ.get("DANIEL_QUOTA_TPM")
+    if not rpm and not tpm:
+        return None
+    return QuotaLimiter(float(rpm) if rpm else None, float(tpm) if tpm else None, os.environ.get("DANIEL_QUOTA_DB"))
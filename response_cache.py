@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache of Daniel's replies to the short messages people send over and over
+# ("hi", "lol", "what's up"). Each key keeps a small pool of different replies,
+# and the API is only skipped once the pool is full, so answers still vary.
+
+POOL_SIZE = 4                 # distinct replies kept per query
+TTL_SECONDS = 6 * 60 * 60     # a key's replies expire this long after the first one
+MAX_BYTES = 2 * 1024 * 1024   # rough cap on cached text across all keys
+
+_PUNCT_EDGES = re.compile(r"^[\W_]+|[\W_]+$")
+_SPACES = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """
+    Folds the trivial variations of a message together: "Hi!!", " hi" and
+    "HI" all become "hi".
+    """
+    query = _SPACES.sub(" ", query.lower()).strip()
+    return _PUNCT_EDGES.sub("", query) or query
+
+def cache_key(query: str, generation_config: dict) -> str:
+    raw = normalize_query(query) + "\0" + json.dumps(generation_config, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class _Entry:
+    __slots__ = ("created", "replies", "size")
+
+    def __init__(self, created):
+        self.created = created
+        self.replies = []
+        self.size = 0
+
+class ResponseCache:
+    """
+    LRU + TTL cache of reply pools, capped by total bytes of cached text.
+    Pass db_path to back it with SQLite so it survives restarts. Safe to use
+    from the bot's worker threads.
+    """
+
+    def __init__(self, db_path=None, pool_size=POOL_SIZE, ttl=TTL_SECONDS, max_bytes=MAX_BYTES):
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS replies (key TEXT NOT NULL, reply TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS replies_key ON replies (key)")
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM replies WHERE created < ?", (now - self.ttl,))
+        self._db.commit()
+        for key, reply, created in self._db.execute("SELECT key, reply, created FROM replies ORDER BY rowid"):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(created)
+            if len(entry.replies) < self.pool_size:
+                self._add_reply(entry, reply)
+        self._evict(now)
+
+    def _add_reply(self, entry, reply):
+        size = len(reply.encode("utf-8"))
+        entry.replies.append(reply)
+        entry.size += size
+        self._bytes += size
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if self._db is not None:
+            self._db.execute("DELETE FROM replies WHERE key = ?", (key,))
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.ttl]
+        for key in expired:
+            self._drop(key)
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+        if self._db is not None:
+            self._db.commit()
+
+    def get(self, query: str, generation_config: dict):
+        """
+        Returns a cached reply, or None when the caller should ask the API
+        (no entry yet, entry expired, or its pool isn't full).
+        """
+        key = cache_key(query, generation_config)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created > self.ttl:
+                self._drop(key)
+                if self._db is not None:
+                    self._db.commit()
+                entry = None
+            if entry is None or len(entry.replies) < self.pool_size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            reply = random.choice(entry.replies)
+            self.hits += 1
+            self.bytes_saved += len(reply.encode("utf-8"))
+            return reply
+
+    def put(self, query: str, generation_config: dict, reply: str):
+        """Adds a fresh reply to the query's pool, if there's room in it."""
+        key = cache_key(query, generation_config)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(now)
+            self._entries.move_to_end(key)
+            if len(entry.replies) >= self.pool_size or reply in entry.replies:
+                return
+            self._add_reply(entry, reply)
+            if self._db is not None:
+                self._db.execute("INSERT INTO replies (key, reply, created) VALUES (?, ?, ?)", (key, reply, entry.created))
+            self._evict(now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "keys": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+def cache_from_env():
+    """
+    DANIEL_RESPONSE_CACHE unset: no cache. "memory": in-process only.
+    Anything else: path of a SQLite file to keep the cache in.
+    """
+    setting = os.environ.get("DANIEL_RESPONSE_CACHE")
+    if not setting:
+        return None
+    return ResponseCache(db_path=None if setting == "memory" else setting)
@@ -0,0 +1,179 @@
+import json
+import random
+
+import pytest
+
+import build_pairs
+import pair_filters
+
+ME = "200000000000000001"
+OTHERS = ["200000000000000002", "200000000000000003"]
+
+def write_export(path, channel_id, messages):
+    """DiscordChatExporter-style export: the channel id only lives on the channel."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"guild": {"id": "1"}, "channel": {"id": channel_id}, "messages": messages}, f)
+
+def synthetic_exports(directory, n_channels=3, n_messages=400, seed=0):
+    """
+    Channels whose messages interleave in time, with runs of Daniel messages,
+    empty (attachment-only) and whitespace-only content sprinkled in.
+    """
+    rng = random.Random(seed)
+    authors = [build_pairs.DANIEL_ID, ME] + OTHERS
+    paths = []
+    for c in range(n_channels):
+        messages = []
+        for i in range(n_messages):
+            content = rng.choice(["lol", "what", "  yeah bro  ", "", "   ", "berserk is peak", "gym?"])
+            messages.append({
+                "id": str(i),
+                # Every channel gets a different offset, so the merged stream alternates between them
+                "timestamp": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}.{c:03d}+00:00",
+                "content": content,
+                "author": {"id": rng.choices(authors, [3, 2, 1, 1])[0]},
+            })
+        path = directory / f"Server - channel-{c} [{900 + c}].json"
+        write_export(path, str(900 + c), messages)
+        paths.append(str(path))
+    return paths
+
+def load_merged(paths):
+    return list(build_pairs.merge_exports(build_pairs.iter_export(path) for path in paths))
+
+@pytest.mark.parametrize("my_id", [None, ME])
+def test_linear_pairing_matches_walkback(tmp_path, monkeypatch, my_id):
+    monkeypatch.setattr(build_pairs, "MY_ID", my_id)
+    msgs = load_merged(synthetic_exports(tmp_path))
+    assert len({msg[build_pairs.CHANNEL] for msg in msgs}) == 3
+
+    pairs = list(build_pairs.extract_pairs(msgs))
+    assert pairs  # the comparison below means nothing if nothing pairs up
+    assert build_pairs.extract_pairs_walkback(msgs) == pairs
+
+def test_empty_content_is_skipped_but_still_counts_as_a_prompt(tmp_path):
+    daniel = build_pairs.DANIEL_ID
+    write_export(tmp_path / "a.json", "1", [
+        {"timestamp": "2024-01-01T00:00:01+00:00", "content": "hey", "author": {"id": OTHERS[0]}},
+        {"timestamp": "2024-01-01T00:00:02+00:00", "content": "", "author": {"id": OTHERS[1]}},
+        {"timestamp": "2024-01-01T00:00:03+00:00", "content": "yo", "author": {"id": daniel}},
+        {"timestamp": "2024-01-01T00:00:04+00:00", "content": "sup", "author": {"id": OTHERS[0]}},
+        {"timestamp": "2024-01-01T00:00:05+00:00", "content": "  ", "author": {"id": daniel}},
+        {"timestamp": "2024-01-01T00:00:06+00:00", "content": "nm", "author": {"id": daniel}},
+    ])
+    msgs = load_merged([str(tmp_path / "a.json")])
+    # The attachment-only message is the latest prompt, so "yo" pairs with nothing
+    assert list(build_pairs.extract_pairs(msgs)) == [{"user": "sup", "daniel": "nm"}]
+    assert build_pairs.extract_pairs_walkback(msgs) == [{"user": "sup", "daniel": "nm"}]
+
+def test_my_id_only_pairs_with_my_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_pairs, "MY_ID", ME)
+    daniel = build_pairs.DANIEL_ID
+    write_export(tmp_path / "a.json", "1", [
+        {"timestamp": "2024-01-01T00:00:01+00:00", "content": "mine", "author": {"id": ME}},
+        {"timestamp": "2024-01-01T00:00:02+00:00", "content": "not mine", "author": {"id": OTHERS[0]}},
+        {"timestamp": "2024-01-01T00:00:03+00:00", "content": "reply", "author": {"id": daniel}},
+    ])
+    msgs = load_merged([str(tmp_path / "a.json")])
+    assert list(build_pairs.extract_pairs(msgs)) == [{"user": "mine", "daniel": "reply"}]
+    assert build_pairs.extract_pairs_walkback(msgs) == [{"user": "mine", "daniel": "reply"}]
+
+CHUNK_SIZES = [1, 2, 3, 4, 5, 7, 16, 1 << 16]
+
+def check_iter_export(tmp_path, export, expected):
+    path = tmp_path / "export.json"
+    path.write_text(json.dumps(export), encoding="utf-8")
+    for chunk_size in CHUNK_SIZES:
+        assert list(build_pairs.iter_export(str(path), chunk_size)) == expected, chunk_size
+
+@pytest.mark.parametrize("messages_key", ["messages", "Messages"])
+def test_iter_export_dict_with_values_straddling_the_window(tmp_path, messages_key):
+    messages = [
+        {"id": "1", "timestamp": "2024-01-01T00:00:01+00:00", "content": "yo", "author": {"id": ME},
+         "reactions": [{"count": 12345}], "score": -2.5e+10},
+        {"Id": "2", "Timestamp": "2024-01-01T00:00:02+00:00", "Content": "sup 🤙", "Author": {"Id": "7"}},
+        "not a message",
+    ]
+    export = {"ratio": 1.5, "count": 1234567, "exp": 1e-7, "flag": True, "none": None,
+              "channel": {"id": "900"}, messages_key: messages, "after": 0.25}
+    check_iter_export(tmp_path, export, [
+        ("2024-01-01T00:00:01+00:00", "900", ME, "yo"),
+        ("2024-01-01T00:00:02+00:00", "900", "7", "sup 🤙"),
+    ])
+
+def test_iter_export_list(tmp_path):
+    export = [
+        {"timestamp": "2024-01-01T00:00:01+00:00", "channel_id": "5", "content": "hi", "author": {"id": ME}},
+        42.125,
+        {"timestamp": "2024-01-01T00:00:02+00:00", "ChannelId": "6", "content": "", "author": {"id": "9"}},
+    ]
+    check_iter_export(tmp_path, export, [
+        ("2024-01-01T00:00:01+00:00", "5", ME, "hi"),
+        ("2024-01-01T00:00:02+00:00", "6", "9", ""),
+    ])
+
+@pytest.mark.parametrize("export", [{"messages": None, "n": 10.5}, {"messages": []}, {}, []])
+def test_iter_export_without_messages(tmp_path, export):
+    check_iter_export(tmp_path, export, [])
+
+def msg(seconds, channel, author, content):
+    timestamp = f"2024-01-01T00:{seconds // 60:02d}:{seconds % 60:02d}+00:00" if isinstance(seconds, int) else seconds
+    return (timestamp, channel, author, content)
+
+def merged(msgs):
+    return [(row[1], row[2], row[3]) for row in build_pairs.iter_pair_rows(msgs, merge_runs=True)]
+
+def test_merge_runs_joins_back_to_back_replies():
+    daniel = build_pairs.DANIEL_ID
+    msgs = [msg(0, "a", ME, "yo"), msg(1, "a", daniel, "hey"), msg(30, "a", daniel, "  "),
+            msg(60, "a", daniel, "whats up"), msg(70, "a", ME, "nm")]
+    assert merged(msgs) == [("a", "yo", "hey\nwhats up")]
+
+def test_merge_runs_splits_after_merge_gap():
+    daniel = build_pairs.DANIEL_ID
+    gap = build_pairs.MERGE_GAP
+    msgs = [msg(0, "a", ME, "yo"), msg(1, "a", daniel, "hey"), msg(2 + gap, "a", daniel, "u there?")]
+    assert merged(msgs) == [("a", "yo", "hey"), ("a", "yo", "u there?")]
+
+def test_merge_runs_keeps_rows_in_start_order_across_channels():
+    daniel = build_pairs.DANIEL_ID
+    msgs = [
+        msg(0, "a", ME, "raid tonight?"), msg(1, "a", daniel, "maybe"),
+        msg(2, "b", ME, "gym?"), msg(3, "b", daniel, "leg day"), msg(4, "b", ME, "nice"),  # b's run ends first...
+        msg(10, "a", daniel, "if im done with hw"),                                      # ...but a's started earlier
+    ]
+    rows = list(build_pairs.iter_pair_rows(msgs, merge_runs=True))
+    assert [(row[1], row[3]) for row in rows] == [("a", "maybe\nif im done with hw"), ("b", "leg day")]
+    assert [row[0] for row in rows] == [msgs[1][0], msgs[3][0]]
+
+def test_merge_runs_doesnt_merge_without_timestamps():
+    daniel = build_pairs.DANIEL_ID
+    msgs = [msg("", "a", ME, "yo"), msg("", "a", daniel, "hey"), msg("", "a", daniel, "sup")]
+    assert merged(msgs) == [("a", "yo", "hey"), ("a", "yo", "sup")]
+
+def test_merge_runs_without_a_gap_matches_plain_pairing(tmp_path, monkeypatch):
+    msgs = load_merged(synthetic_exports(tmp_path))
+    monkeypatch.setattr(build_pairs, "MERGE_GAP", 0)  # every timestamp differs, so no run lasts past one message
+    assert list(build_pairs.iter_pair_rows(msgs, merge_runs=True)) == list(build_pairs.iter_pair_rows(msgs))
+    monkeypatch.setattr(build_pairs, "MERGE_GAP", 120)
+    rows = list(build_pairs.iter_pair_rows(msgs, merge_runs=True))
+    assert rows and [row[0] for row in rows] == sorted(row[0] for row in rows)
+
+def test_incremental_rebuild_filters_cached_rows_like_a_full_rebuild(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    synthetic_exports(tmp_path)
+
+    def build(*args):
+        build_pairs.main(list(args))
+        report = [line for line in capsys.readouterr().out.splitlines() if line.startswith("🧹")]
+        with open(build_pairs.OUTPUT, encoding="utf-8") as f:
+            return json.load(f), report
+
+    full = build("--full")
+    assert full[1] and "removed" in full[1][0]  # the synthetic chatter has duplicates to drop
+    assert build() == full   # cold: fills the cache
+
+    def not_again(*args, **kwargs):
+        raise AssertionError("a warm rebuild should use the cached filter features")
+    monkeypatch.setattr(pair_filters, "dedup_keys", not_again)
+    assert build() == full   # warm: filters the cached rows and features
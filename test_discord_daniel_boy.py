@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeChannel
+from conversation_memory import ConversationMemory
+from response_cache import ResponseCache
+from fake_gemini import REPLY
+
+bot = pytest.importorskip("discord_daniel_boy")
+
+class Author:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+
+class Message:
+    def __init__(self, author, channel, guild=None):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+
+@pytest.fixture
+def memory(monkeypatch):
+    memory = ConversationMemory()
+    monkeypatch.setattr(bot, "MEMORY", memory)
+    return memory
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_successful_reply_is_remembered(fake_core, memory, monkeypatch, stream):
+    monkeypatch.setattr(bot, "STREAM_REPLIES", stream)
+    fake_core(chunk_delay=0)
+    channel = FakeChannel()
+    asyncio.run(bot.answer_mentions([(Message(Author(1), channel), "yo what's up")]))
+
+    assert channel.events[-1][2] == "<@1> " + REPLY
+    assert [turn["role"] for turn in memory.contents(channel.id)] == ["user", "model"]
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fallback_reply_is_not_remembered(fake_core, memory, monkeypatch, stream):
+    monkeypatch.setattr(bot, "STREAM_REPLIES", stream)
+    fake_core(error_rate=1.0)
+    channel = FakeChannel()
+    asyncio.run(bot.answer_mentions([(Message(Author(1), channel), "yo what's up")]))
+
+    assert "momentarily offline" in channel.events[-1][2]
+    assert memory.contents(channel.id) == []
+
+def test_cut_off_stream_is_not_remembered(fake_core, memory, monkeypatch):
+    monkeypatch.setattr(bot, "STREAM_REPLIES", True)
+    fake_core(chunk_delay=0, cut_after=2)
+    channel = FakeChannel()
+    asyncio.run(bot.answer_mentions([(Message(Author(1), channel), "yo what's up")]))
+
+    assert memory.contents(channel.id) == []
+
+def test_mentions_past_the_cap_get_one_slow_down_reply(fake_core, memory):
+    fake_core(chunk_delay=0)
+    spammer, other = Author(1), Author(2)
+    channel = FakeChannel()
+
+    async def run():
+        scheduler = bot.MentionScheduler(window=0.1, workers=1)
+        accepted = [await scheduler.submit(Message(spammer, channel), f"yo {i}") for i in range(5)]
+        accepted.append(await scheduler.submit(Message(other, channel), "gym?"))
+        await asyncio.sleep(0.5)  # let the batch be answered and the queue drain
+        accepted.append(await scheduler.submit(Message(spammer, channel), "yo again"))
+        return accepted
+
+    accepted = asyncio.run(run())
+    assert accepted == [True] * bot.USER_MAX_PENDING + [False] * (5 - bot.USER_MAX_PENDING) + [True, True]
+    slow_downs = [content for _, _, content in channel.events if bot.SLOW_DOWN_REPLY in content]
+    assert slow_downs == [f"<@1> {bot.SLOW_DOWN_REPLY}"]
+
+def test_repeated_greeting_in_an_active_channel_is_served_from_the_cache(fake_core, memory):
+    fake = fake_core()
+    bot.CORE._cache = ResponseCache(pool_size=1)
+    channel = FakeChannel()
+    memory.record(channel.id, "did you see the new berserk chapter", "bro it was peak")
+
+    async def run():
+        for greeting in ("hi", "Hi!!", " hi "):
+            await bot.answer_mentions([(Message(Author(1), channel), greeting)])
+    asyncio.run(run())
+
+    assert fake.requests == 1
+    assert bot.CORE.cache.stats()["hits"] == 2
+    assert [content for _, _, content in channel.events] == ["<@1> " + REPLY] * 3
+
+def test_long_query_in_an_active_channel_skips_the_cache(fake_core, memory):
+    fake = fake_core()
+    bot.CORE._cache = ResponseCache(pool_size=1)
+    channel = FakeChannel()
+    memory.record(channel.id, "yo", "sup")
+
+    async def run():
+        for _ in range(2):
+            await bot.answer_mentions([(Message(Author(1), channel), "what did you think of that chapter")])
+    asyncio.run(run())
+
+    assert fake.requests == 2
+    assert bot.CORE.cache.stats()["hits"] == 0
+
+def test_shards_share_one_quota_file_by_default(fake_core, monkeypatch):
+    monkeypatch.setenv("DISCORD_BOT_TOKEN", "token")
+    monkeypatch.setenv("GEMINI_API_KEY", "key")
+    monkeypatch.setenv("DANIEL_QUOTA_RPM", "15")
+    monkeypatch.setenv("DANIEL_QUOTA_DB", "")  # unset, but restored after main() sets it
+    monkeypatch.setattr(bot, "run_shards", lambda token, shard_count: 0)
+    assert bot.main(["--shards", "2"]) == 0
+    assert bot.os.environ["DANIEL_QUOTA_DB"] == bot.SHARD_QUOTA_DB
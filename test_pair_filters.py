@@ -0,0 +1,65 @@
+import pytest
+
+from pair_filters import EXCLUDED_CHANNELS, PairFilter, pair_features
+
+CHANNEL = "900"
+SENTENCE = "did you see the new berserk chapter last night it was actually insane"
+REPLY = "yeah bro guts going full berserker armor was so peak i cant believe it"
+
+def rows(*pairs, channel=CHANNEL):
+    return [(f"2024-01-01T00:00:{i:02d}+00:00", channel, user, daniel) for i, (user, daniel) in enumerate(pairs)]
+
+def with_features(rows):
+    return [row + (pair_features(row[2], row[3]),) for row in rows]
+
+def run(pair_filter, rows):
+    return [row[2:4] for row in pair_filter.filter(rows)]
+
+@pytest.mark.parametrize("channel, user, daniel, rule", [
+    (next(iter(EXCLUDED_CHANNELS)), "$wa", "Rem (Re:Zero)", "channel"),
+    (CHANNEL, "!play never gonna give you up", "lmao", "bot_command"),
+    (CHANNEL, "yo", "/roll d20", "bot_command"),
+    (CHANNEL, "k", "ok", "length"),
+    (CHANNEL, "copypasta", "a" * 1001, "length"),
+    (CHANNEL, "check this", "https://example.com/a/very/long/link lol", "links"),
+])
+def test_each_rule(channel, user, daniel, rule):
+    for row in (rows((user, daniel), channel=channel), with_features(rows((user, daniel), channel=channel))):
+        pair_filter = PairFilter()
+        assert run(pair_filter, row) == []
+        assert pair_filter.counts == {rule: 1}
+
+def test_settings_apply_to_cached_features():
+    pair = ("check this out", "https://example.com lol")
+    assert run(PairFilter(max_url_ratio=0.9), with_features(rows(pair))) == [pair]
+    assert run(PairFilter(min_chars=20), with_features(rows(pair))) == []
+    assert run(PairFilter(excluded_channels={"5"}), with_features(rows(pair, channel="5"))) == []
+
+def test_exact_duplicates_ignore_case_and_spacing():
+    pair_filter = PairFilter()
+    kept = run(pair_filter, rows(("yo what's up", "nm"), ("YO  what's up", "NM"), ("yo what's up", "gaming")))
+    assert kept == [("yo what's up", "nm"), ("yo what's up", "gaming")]
+    assert pair_filter.counts == {"exact_duplicate": 1}
+
+def test_near_duplicates():
+    pair_filter = PairFilter()
+    kept = run(pair_filter, rows(
+        (SENTENCE, REPLY),
+        (SENTENCE + " lol", REPLY),             # one extra word: near duplicate
+        (SENTENCE, "nah i havent read it yet"),  # same question, different answer: kept
+        ("anyone up for the raid tonight", REPLY),
+    ))
+    assert kept == [(SENTENCE, REPLY), (SENTENCE, "nah i havent read it yet"), ("anyone up for the raid tonight", REPLY)]
+    assert pair_filter.counts == {"near_duplicate": 1}
+    assert run(PairFilter(near_dup=False), rows((SENTENCE, REPLY), (SENTENCE + " lol", REPLY))) == [
+        (SENTENCE, REPLY), (SENTENCE + " lol", REPLY)]
+
+def test_short_pairs_only_get_the_exact_check():
+    assert run(PairFilter(), rows(("lol", "lmao"), ("lol", "lmao ok"))) == [("lol", "lmao"), ("lol", "lmao ok")]
+
+def test_cached_features_give_the_same_verdicts():
+    pairs = [(SENTENCE, REPLY), (SENTENCE + " lol", REPLY), ("Yo", "sup"), ("yo", "SUP"), ("k", "ok"),
+             ("!play x", "no"), ("look https://x.co/aaaaaaaaaaaaaaaa", "ok"), ("gym?", "leg day")]
+    plain, cached = PairFilter(), PairFilter()
+    assert run(plain, rows(*pairs)) == run(cached, with_features(rows(*pairs)))
+    assert plain.counts == cached.counts and plain.kept == cached.kept
@@ -0,0 +1,51 @@
+import json
+import os
+
+from pair_index import build_index, open_index
+from pair_store import PairStore, PairStoreWriter, open_pairs
+
+def write_dataset(tmp_path, pairs):
+    json_path = tmp_path / "pairs.json"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(pairs, f)
+    return str(json_path)
+
+def write_store(tmp_path, pairs):
+    store_path = str(tmp_path / "pairs.bin")
+    with PairStoreWriter(store_path) as writer:
+        for pair in pairs:
+            writer.add(pair["user"], pair["daniel"])
+    return store_path
+
+def age(path, seconds):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 1_000_000_000))
+
+def test_store_round_trips_pairs(tmp_path):
+    pairs = [{"user": "yo", "daniel": "sup"}, {"user": "berserk?", "daniel": "peak fiction ✨"}]
+    store = PairStore(write_store(tmp_path, pairs))
+    assert len(store) == 2
+    assert list(store) == pairs
+
+def test_open_pairs_ignores_a_store_older_than_the_json(tmp_path):
+    old = [{"user": "old", "daniel": "pair"}, {"user": "removed", "daniel": "pair"}]
+    new = [{"user": "new", "daniel": "pair"}]
+    store_path = write_store(tmp_path, old)
+    json_path = write_dataset(tmp_path, new)
+    age(store_path, 60)
+    assert open_pairs(store_path, json_path) == new
+
+def test_open_pairs_prefers_a_fresh_store(tmp_path):
+    pairs = [{"user": "a", "daniel": "b"}]
+    json_path = write_dataset(tmp_path, pairs)
+    age(json_path, 60)
+    assert isinstance(open_pairs(write_store(tmp_path, pairs), json_path), PairStore)
+
+def test_open_index_ignores_an_index_older_than_the_json(tmp_path):
+    index_path = str(tmp_path / "pairs.idx")
+    build_index(["what raid tonight", "gym later"], index_path)
+    json_path = write_dataset(tmp_path, [{"user": "x", "daniel": "y"}] * 2)
+    age(json_path, 60)
+    assert open_index(2, index_path, json_path) is not None
+    age(index_path, 120)
+    assert open_index(2, index_path, json_path) is None
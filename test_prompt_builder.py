@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from prompt_builder import HISTORY_SHARE, MIN_USER_CHARS, PromptBuilder
+
+PERSONA = "You are Daniel.\n\n"
+
+def test_examples_stay_within_budget():
+    builder = PromptBuilder(PERSONA, budget=400)
+    examples = [{"user": f"question {i}", "daniel": "answer " * 5} for i in range(50)]
+    prompt, stats = builder.build("yo", examples)
+    assert len(prompt) <= 400
+    assert stats["chars"] == len(prompt)
+    assert 0 < stats["examples"] < 50
+    assert prompt.startswith(PERSONA) and prompt.endswith("User: yo\nDaniel:")
+
+def test_oversize_examples_are_skipped():
+    builder = PromptBuilder(PERSONA, budget=2000, max_example_chars=100)
+    prompt, stats = builder.build("yo", [{"user": "x" * 200, "daniel": "y"}, {"user": "hi", "daniel": "sup"}])
+    assert stats == {"chars": len(prompt), "est_tokens": len(prompt) // 4, "examples": 1, "skipped": 1,
+                     "history_turns": 0, "history_dropped": 0}
+    assert "x" * 200 not in prompt
+
+def test_long_user_message_is_cut_not_dropped():
+    builder = PromptBuilder(PERSONA, budget=len(PERSONA) + 20 + MIN_USER_CHARS)
+    prompt, _ = builder.build("z" * 5000, [{"user": "hi", "daniel": "sup"}])
+    assert len(prompt) <= builder.budget
+    assert prompt.count("z") >= MIN_USER_CHARS
+
+def test_budget_smaller_than_persona_is_rejected():
+    with pytest.raises(ValueError, match="DANIEL_PROMPT_BUDGET"):
+        PromptBuilder("p" * 1000, budget=1000)
+
+def test_budget_comes_from_the_environment_when_built(monkeypatch):
+    monkeypatch.setenv("DANIEL_PROMPT_BUDGET", "5000")
+    assert PromptBuilder(PERSONA).budget == 5000
+    monkeypatch.setenv("DANIEL_PROMPT_BUDGET", "lots")
+    with pytest.raises(ValueError, match="DANIEL_PROMPT_BUDGET"):
+        PromptBuilder(PERSONA)
+
+@pytest.mark.parametrize("budget", ["lots", "10"])
+def test_bad_budget_doesnt_break_importing_the_bots(budget):
+    env = dict(os.environ, DANIEL_PROMPT_BUDGET=budget)
+    code = "import chat_with_daniel_rest, discord_daniel_boy, daniel_core; daniel_core.DanielCore('p', {}).preload()"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    # Only preload() trips over it, and it exits with an explanation instead of a traceback
+    assert result.returncode == 1
+    assert "❗ Error: " in result.stdout and "DANIEL_PROMPT_BUDGET" in result.stdout
+    assert "Traceback" not in result.stderr
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+def test_history_counts_against_the_budget():
+    builder = PromptBuilder(PERSONA, budget=1000)
+    history = []
+    for i in range(6):
+        history += [turn("user", f"{i}" * 100), turn("model", f"{i}" * 100)]
+    examples = [{"user": f"question {i}", "daniel": "answer " * 5} for i in range(50)]
+    prompt, stats = builder.build("yo", examples, history)
+
+    kept = history[len(history) - stats["history_turns"]:]
+    history_chars = sum(len(t["parts"][0]["text"]) for t in kept)
+    assert stats["chars"] == len(prompt) + history_chars <= 1000
+    # The oldest exchanges go first, whole, so the rest still opens with a user turn
+    assert stats["history_dropped"] > 0 and stats["history_dropped"] % 2 == 0
+    assert kept == history[-len(kept):] and kept[0]["role"] == "user"
+    room = 1000 - len(PERSONA) - len("User: yo\nDaniel:")
+    assert history_chars <= room * HISTORY_SHARE
+    # ...and leaves the examples the rest
+    assert stats["examples"] > 0
+
+def test_short_history_is_kept_whole():
+    builder = PromptBuilder(PERSONA, budget=2000)
+    history = [turn("user", "yo"), turn("model", "sup")]
+    prompt, stats = builder.build("gym?", [{"user": "hi", "daniel": "sup"}], history)
+    assert stats["history_turns"] == 2 and stats["history_dropped"] == 0
+    assert stats["chars"] == len(prompt) + len("yo") + len("sup")
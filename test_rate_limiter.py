@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import QuotaLimiter
+
+def test_admits_within_quota_then_sheds_low_priority():
+    limiter = QuotaLimiter(requests_per_minute=6)  # refills one request every 10s
+    assert all(limiter.admit(10) for _ in range(6))
+    start = time.monotonic()
+    assert not limiter.admit(10, "low")
+    assert time.monotonic() - start < 0.5  # shed up front, not after waiting
+
+def test_high_priority_waits_for_quota(monkeypatch):
+    monkeypatch.setitem(rate_limiter.MAX_WAIT, "low", 0.1)
+    limiter = QuotaLimiter(requests_per_minute=240)  # one request every 0.25s
+    limiter.drain()
+    assert not limiter.admit(10, "low")
+    start = time.monotonic()
+    assert limiter.admit(10, "high")
+    assert 0.1 < time.monotonic() - start < 1.0
+
+def test_token_bucket_limits_big_requests():
+    limiter = QuotaLimiter(tokens_per_minute=1000)
+    assert limiter.admit(900)
+    assert not limiter.admit(900, "low")
+    assert limiter.admit(50, "low")
+
+def test_drain_empties_the_buckets():
+    limiter = QuotaLimiter(requests_per_minute=6, tokens_per_minute=1000)
+    limiter.drain()
+    assert not limiter.admit(10, "low")
+
+def test_sqlite_buckets_are_shared_between_limiters(tmp_path):
+    db = str(tmp_path / "quota.sqlite3")
+    a = QuotaLimiter(requests_per_minute=6, db_path=db)
+    b = QuotaLimiter(requests_per_minute=6, db_path=db)
+    assert all(limiter.admit(10) for limiter in (a, b, a, b, a, b))
+    assert not a.admit(10, "low")
+    assert not b.admit(10, "low")
+    # ...and so is a drain, which also survives reopening the file
+    c = QuotaLimiter(requests_per_minute=60, db_path=db)
+    c.drain()
+    assert not QuotaLimiter(requests_per_minute=6, db_path=db).admit(10, "low")
+
+def test_limiter_from_env(monkeypatch, tmp_path):
+    for name in ("DANIEL_QUOTA_RPM", "DANIEL_QUOTA_TPM", "DANIEL_QUOTA_DB"):
+        monkeypatch.delenv(name, raising=False)
+    assert rate_limiter.limiter_from_env() is None
+    monkeypatch.setenv("DANIEL_QUOTA_RPM", "15")
+    monkeypatch.setenv("DANIEL_QUOTA_DB", str(tmp_path / "quota.sqlite3"))
+    limiter = rate_limiter.limiter_from_env()
+    assert limiter.buckets == {"requests": (15.0, 0.25)} and limiter._db is not None
+
+@pytest.mark.parametrize("with_limiter, expected_requests", [(False, 3), (True, 1)])
+def test_429_retries_go_through_the_limiter(fake_core, monkeypatch, with_limiter, expected_requests):
+    import discord_daniel_boy as bot
+    import gemini_client
+    monkeypatch.setattr(gemini_client, "MAX_RETRIES", 2)
+    fake = fake_core(rate_limit_rate=1.0, retry_after=0)
+    if with_limiter:
+        # Plenty of quota for the first call; after the 429 drains it, a retry would wait ~10s
+        bot.CORE._limiter = QuotaLimiter(requests_per_minute=6)
+    reply, ok = bot.CORE.ask("what are you doing tonight", priority="low")
+    assert not ok
+    assert fake.requests == expected_requests
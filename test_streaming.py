@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeChannel as Channel
+from fake_gemini import REPLY
+
+bot = pytest.importorskip("discord_daniel_boy")
+import gemini_client
+
+EDIT_INTERVAL = 0.2
+
+@pytest.fixture(autouse=True)
+def fast_edits(monkeypatch):
+    monkeypatch.setattr(bot, "EDIT_INTERVAL", EDIT_INTERVAL)
+
+def test_stream_json_yields_every_chunk(fake_core):
+    fake = fake_core(stream_chunks=5, chunk_delay=0)
+    events = list(gemini_client.stream_json(fake.url(stream=True), {"contents": []}))
+    texts = [e["candidates"][0]["content"]["parts"][0]["text"] for e in events]
+    assert len(texts) > 1
+    assert "".join(texts) == REPLY
+
+def test_first_chunk_sent_at_once_then_throttled_edits(fake_core):
+    fake_core(stream_chunks=10, chunk_delay=0.05)
+    channel = Channel()
+    text, ok = asyncio.run(bot.send_streamed_reply(channel, "<@1> ", "yo"))
+
+    assert ok and text == REPLY
+    kinds = [kind for _, kind, _ in channel.events]
+    assert kinds[0] == "send" and set(kinds[1:]) == {"edit"}
+    # The first chunk goes out well before the whole ~0.5s stream has arrived
+    first_at, _, first = channel.events[0]
+    assert first_at < 0.25
+    assert REPLY.startswith(first[len("<@1> "):]) and first != "<@1> " + REPLY
+    # Edits come at most once per EDIT_INTERVAL (the final one may follow sooner)
+    times = [at for at, _, _ in channel.events]
+    gaps = [b - a for a, b in zip(times, times[1:-1])]
+    assert all(gap >= EDIT_INTERVAL * 0.9 for gap in gaps)
+    assert len(channel.events) < 10  # fewer messages than chunks
+    assert channel.events[-1][2] == "<@1> " + REPLY
+
+def test_cut_off_stream_keeps_what_arrived(fake_core):
+    fake_core(stream_chunks=10, chunk_delay=0, cut_after=3)
+    channel = Channel()
+    text, ok = asyncio.run(bot.send_streamed_reply(channel, "", "yo"))
+
+    assert not ok  # partial: not remembered as Daniel's turn
+    assert text and REPLY.startswith(text) and text != REPLY
+    assert channel.events[-1][2] == text
+
+def test_http_error_before_stream_sends_fallback(fake_core):
+    fake_core(error_rate=1.0)
+    channel = Channel()
+    text, ok = asyncio.run(bot.send_streamed_reply(channel, "<@1> ", "yo"))
+
+    assert not ok
+    assert text == "Daniel is momentarily offline due to an API error. Try again later."
+    assert [(kind, content) for _, kind, content in channel.events] == [("send", "<@1> " + text)]